@@ -0,0 +1,240 @@
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from metadata import read_info
+
+
+class Budget:
+    # Wspólny dla procesu limit zasobu (np. bajtów zdekodowanych pikseli):
+    # acquire() czeka, aż zwolni się dość miejsca. Pojedyncze żądanie
+    # większe niż cały limit przechodzi, gdy nic innego nie jest w toku -
+    # inaczej czekałoby w nieskończoność.
+    def __init__(self, capacity, name):
+        self.capacity = capacity
+        self.name = name
+        self.used = 0
+        self.peak = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self, units):
+        if not units:
+            return 0.0
+        start = time.perf_counter()
+        with self._condition:
+            if self.used and self.used + units > self.capacity:
+                self.waiting += 1
+                try:
+                    self._condition.wait_for(
+                        lambda: not self.used or self.used + units <= self.capacity
+                    )
+                finally:
+                    self.waiting -= 1
+            wait = time.perf_counter() - start
+            self.used += units
+            self.peak = max(self.peak, self.used)
+            self.admitted += 1
+            if wait > 0.001:
+                self.waited += 1
+            self.wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+        return wait
+
+    def release(self, units):
+        if not units:
+            return
+        with self._condition:
+            self.used -= units
+            self._condition.notify_all()
+
+    @contextmanager
+    def reserve(self, units):
+        # Zwraca czas oczekiwania na przydział (w sekundach)
+        wait = self.acquire(units)
+        try:
+            yield wait
+        finally:
+            self.release(units)
+
+    def stats(self):
+        with self._condition:
+            return {
+                "capacity": self.capacity,
+                "used": self.used,
+                "peak": self.peak,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "waited": self.waited,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "max_wait_seconds": round(self.max_wait_seconds, 3),
+            }
+
+
+class SharedLimit:
+    # Limit liczby jednoczesnych operacji (np. detekcji twarzy) wspólny dla
+    # procesu głównego i procesów roboczych puli. Miejsca to PID-y
+    # właścicieli w pamięci współdzielonej - miejsce procesu, który padł
+    # (np. OOM w trakcie detekcji), jest odzyskiwane, zamiast blokować limit
+    # na zawsze. BatchEngine przekazuje stan procesom przez inicjalizator
+    # (share() w procesie głównym, attach() w roboczym). Interfejs
+    # i statystyki jak w Budget.
+    USED, PEAK, WAITING, ADMITTED, WAITED, WAIT_SECONDS, MAX_WAIT = range(7)
+
+    def __init__(self, capacity, name):
+        self.capacity = max(capacity, 1)
+        self.name = name
+        self._state = None
+        self._lock = threading.Lock()
+
+    def share(self):
+        with self._lock:
+            if self._state is None:
+                context = multiprocessing.get_context("spawn")
+                self._state = (
+                    context.Condition(),
+                    context.Array("q", self.capacity, lock=False),
+                    context.Array("d", 7, lock=False),
+                )
+            return self._state
+
+    def attach(self, state):
+        with self._lock:
+            self._state = state
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            pass
+        return True
+
+    def acquire(self, units):
+        if not units:
+            return 0.0
+        units = min(units, self.capacity)
+        condition, slots, counters = self.share()
+        start = time.perf_counter()
+        waiting = False
+        with condition:
+            while True:
+                free = [i for i, pid in enumerate(slots) if not pid]
+                if len(free) < units:
+                    # Miejsca procesów, których już nie ma
+                    for i, pid in enumerate(slots):
+                        if pid and not self._alive(pid):
+                            slots[i] = 0
+                            counters[self.USED] -= 1
+                            free.append(i)
+                if len(free) >= units:
+                    break
+                if not waiting:
+                    waiting = True
+                    counters[self.WAITING] += 1
+                condition.wait(timeout=1.0)
+            if waiting:
+                counters[self.WAITING] -= 1
+            for i in free[:units]:
+                slots[i] = os.getpid()
+            wait = time.perf_counter() - start
+            counters[self.USED] += units
+            counters[self.PEAK] = max(counters[self.PEAK], counters[self.USED])
+            counters[self.ADMITTED] += 1
+            if wait > 0.001:
+                counters[self.WAITED] += 1
+            counters[self.WAIT_SECONDS] += wait
+            counters[self.MAX_WAIT] = max(counters[self.MAX_WAIT], wait)
+        return wait
+
+    def release(self, units):
+        if not units:
+            return
+        units = min(units, self.capacity)
+        condition, slots, counters = self.share()
+        pid = os.getpid()
+        with condition:
+            for i in [i for i, owner in enumerate(slots) if owner == pid][:units]:
+                slots[i] = 0
+                counters[self.USED] -= 1
+            condition.notify_all()
+
+    @contextmanager
+    def reserve(self, units):
+        wait = self.acquire(units)
+        try:
+            yield wait
+        finally:
+            self.release(units)
+
+    def stats(self):
+        condition, _, counters = self.share()
+        with condition:
+            values = list(counters)
+        return {
+            "capacity": self.capacity,
+            "used": int(values[self.USED]),
+            "peak": int(values[self.PEAK]),
+            "waiting": int(values[self.WAITING]),
+            "admitted": int(values[self.ADMITTED]),
+            "waited": int(values[self.WAITED]),
+            "wait_seconds": round(values[self.WAIT_SECONDS], 3),
+            "max_wait_seconds": round(values[self.MAX_WAIT], 3),
+        }
+
+
+def footprint(source):
+    # Szacunek pamięci zdekodowanego obrazu z samego nagłówka (source: bajty,
+    # ścieżka albo obiekt plikowy); uszkodzony plik i tak zgłosi błąd przy
+    # dekodowaniu, więc liczy się jako 0
+    info = read_info(source)
+    return info.footprint if info is not None else 0
+
+
+def file_cost(name, data):
+    # Koszt pliku dla BatchEngine.map: (nazwa, bajty lub ścieżka) -> bajty
+    return footprint(data)
+
+
+# Bajty zdekodowanych pikseli w toku w całym procesie (wszystkie sesje,
+# zadania i żądania HTTP) - przydzielane w procesie głównym przed
+# przekazaniem pliku do puli - oraz liczba jednoczesnych detekcji twarzy
+# łącznie w procesie głównym i wszystkich procesach roboczych
+decode_budget = Budget(
+    int(os.environ.get("RESIZER_PIXEL_BUDGET_MB", 1024)) << 20, "decode"
+)
+detect_budget = SharedLimit(
+    int(os.environ.get("RESIZER_DETECT_CONCURRENCY", 1)), "detect"
+)
+
+
+def shared_state():
+    # Stan przekazywany procesom roboczym przy ich uruchomieniu
+    return {"detect": detect_budget.share()}
+
+
+def attach(state):
+    detect_budget.attach(state["detect"])
+
+
+def stats():
+    return {budget.name: budget.stats() for budget in (decode_budget, detect_budget)}
+
+
+def summary():
+    decode = decode_budget.stats()
+    detect = detect_budget.stats()
+    return (
+        f"Budżet pikseli: {decode['used'] >> 20} z {decode['capacity'] >> 20} MB "
+        f"(szczyt {decode['peak'] >> 20} MB), oczekiwania: {decode['waited']} "
+        f"({decode['wait_seconds']:.1f} s); detekcje czekały: {detect['waited']} "
+        f"({detect['wait_seconds']:.1f} s)"
+    )
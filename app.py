@@ -1,78 +1,272 @@
 import streamlit as st
-from PIL import Image
 import os
 import io
-import cv2
-import numpy as np
-from retinaface import RetinaFace
-import time
-import zipfile
-
-
-def detect_faces(image):
-    img_array = np.array(image)
-    faces = RetinaFace.detect_faces(img_array)
-    return faces
+from encoder import EncodeTask, encode_all
+from quality_search import PRESETS, effort_for, effort_key
+from resampling import DEFAULT_RESAMPLER, RESAMPLERS, resampler_key
+from resize_plan import BASE_WIDTH, plan_cropped
+from decode import decode_image
+from frame import Frame, decode_frame
+from archive import ZipSpool
+from face_detection import DEFAULT_BACKEND, available_backends, get_detector, prewarm
+from result_cache import content_hash, profile_key, result_cache
+from job_view import (
+    current_job,
+    dedup_summary,
+    mode_index,
+    mode_select,
+    show_job,
+    submit_job,
+    upload_index,
+)
+import admission
+from admission import decode_budget, detect_budget, footprint
+from instrumentation import LOG_PATH, recording, span, summarize, write_jsonl
+
+DETECTOR_LABELS = {
+    "retinaface": "RetinaFace (dokładny, wolny)",
+    "opencv": "OpenCV - kaskada Haara (szybki)",
+    "opencv-dnn": "OpenCV DNN - YuNet",
+    "mtcnn": "MTCNN (facenet-pytorch)",
+    "none": "Bez wykrywania twarzy",
+}
+
+
+def detect_faces(image, cache_key=None, backend=None):
+    detector = get_detector(backend)
+    with span("detect_faces", detector.name) as stage:
+        key = ("detect_faces", detector.name, cache_key)
+        if cache_key is not None:
+            faces = result_cache.get(key)
+            if faces is not None:
+                stage.set(cached=True, faces=len(faces))
+                return faces
+
+        # Osobny limit jednoczesnych detekcji - modele są najbardziej pamięcio-
+        # i procesorożerne; czas oczekiwania trafia do pomiaru etapu
+        with detect_budget.reserve(1) as wait:
+            faces = detector.detect(image)
+        stage.set(faces=len(faces), wait_ms=round(wait * 1000, 1))
+        if cache_key is not None:
+            result_cache.put(key, faces)
+        return faces
 
 
 def highlight_faces(image, faces, margin=0.2):
-    img_array = np.array(image)
-    img_height, img_width, _ = img_array.shape
-
-    for face in faces.values():
-        facial_area = face["facial_area"]
-
-        # Expand the facial area upwards by the margin
-        top_margin = int(facial_area[1] * margin)
-        expanded_top = max(facial_area[1] - top_margin, 0)
-
-        cv2.rectangle(
-            img_array,
-            (facial_area[0], expanded_top),
-            (facial_area[2], facial_area[3]),
-            (255, 0, 0),
-            2,
+    # Ramki rysowane w miejscu w buforze klatki; zwykły obraz PIL jest
+    # najpierw kopiowany do nowej klatki, więc oryginał zostaje nietknięty
+    # OpenCV importowany przy pierwszym użyciu, nie przy starcie aplikacji
+    import cv2
+
+    with span("highlight_faces", faces=len(faces)):
+        frame = image if isinstance(image, Frame) else Frame.from_image(image)
+
+        for face in faces.values():
+            facial_area = face["facial_area"]
+
+            # Expand the facial area upwards by the margin
+            top_margin = int(facial_area[1] * margin)
+            expanded_top = max(facial_area[1] - top_margin, 0)
+
+            cv2.rectangle(
+                frame.pixels,
+                (facial_area[0], expanded_top),
+                (facial_area[2], facial_area[3]),
+                (255, 0, 0),
+                2,
+            )
+        return frame.image
+
+
+def process_image(
+    image,
+    output_sizes,
+    encodes=None,
+    cache_key=None,
+    effort=None,
+    resampler=None,
+    original_size=None,
+):
+    # cache_key identyfikuje treść obrazu wejściowego (np. skrót pliku);
+    # effort: preset kodera ("fast"/"balanced"/"max") lub {profil: preset};
+    # resampler: metoda skalowania z resampling.RESAMPLERS lub {profil: metoda};
+    # original_size: wymiary pliku przed dekodowaniem z draft/reduce
+    # (DecodeReport.original_size) - z nich liczone są proporcje
+    if cache_key is not None:
+        key = (
+            "cropped",
+            cache_key,
+            profile_key(output_sizes, "WEBP"),
+            effort_key(effort, output_sizes),
+            resampler_key(resampler, output_sizes),
         )
-    return Image.fromarray(img_array)
+        results = result_cache.get(key)
+        if results is not None:
+            return results
 
-
-def process_image(image, output_sizes):
     results = {}
-    for size, (width, height, max_size_kb) in output_sizes.items():
-        img_copy = image.copy()
-
-        # Skalowanie obrazu do szerokości 1200 pikseli
-        img_copy = img_copy.resize(
-            (1200, int(1200 * img_copy.height / img_copy.width)), Image.LANCZOS
+    # Wspólny plan skalowania: obraz 1200 px liczony raz dla wszystkich profili
+    resized = plan_cropped(
+        image.size, output_sizes, resampler=resampler, original_size=original_size
+    ).execute(image)
+    # Kompresja obrazów do spełnienia wymagań dotyczących rozmiaru pliku,
+    # wszystkie profile równolegle
+    tasks = {
+        size: EncodeTask(
+            resized[size],
+            max_size_kb,
+            "WEBP",
+            (size, width, max_size_kb, "WEBP"),
+            effort_for(effort, size),
         )
+        for size, (width, height, max_size_kb) in output_sizes.items()
+    }
+    for size, result in encode_all(tasks).items():
+        if encodes is not None:
+            encodes[size] = result.encodes
+        results[size] = result.data
+
+    if cache_key is not None:
+        result_cache.put(key, results)
+    return results
 
-        # Przycinanie obrazu do odpowiednich proporcji
-        img_width, img_height = img_copy.size
-        aspect_ratio = width / height
 
-        if img_width / img_height > aspect_ratio:
-            new_width = int(img_height * aspect_ratio)
-            offset = (img_width - new_width) // 2
-            img_copy = img_copy.crop((offset, 0, offset + new_width, img_height))
+def cached_upload(name, data, output_sizes, effort=None, detector=None, resampler=None):
+    # Wynik z pamięci podręcznej - bez dekodowania i bez wysyłania do puli
+    source_key = ("highlighted", content_hash(data), detector or DEFAULT_BACKEND)
+    key = (
+        "cropped",
+        source_key,
+        profile_key(output_sizes, "WEBP"),
+        effort_key(effort, output_sizes),
+        resampler_key(resampler, output_sizes),
+    )
+    results = result_cache.get(key)
+    if results is not None:
+        return results, {}, None, None
+
+
+def process_upload(
+    name,
+    data,
+    output_sizes,
+    metrics=False,
+    effort=None,
+    detector=None,
+    resampler=None,
+):
+    # Zadanie dla procesu roboczego: bajty pliku -> zakodowane profile;
+    # detector="none" pomija wykrywanie twarzy
+    cached = cached_upload(name, data, output_sizes, effort, detector, resampler)
+    if cached is not None:
+        return cached
+
+    detector = detector or DEFAULT_BACKEND
+    with recording(name, metrics) as recorder:
+        source_hash = content_hash(data)
+        frame, decode_report = decode_frame(io.BytesIO(data), BASE_WIDTH)
+        if detector == "none":
+            highlighted_image = frame.image
         else:
-            new_height = int(img_width / aspect_ratio)
-            offset = (img_height - new_height) // 2
-            img_copy = img_copy.crop((0, offset, img_width, offset + new_height))
-
-        # Skalowanie obrazu do docelowego rozmiaru
-        img_copy = img_copy.resize((width, height), Image.LANCZOS)
-
-        # Kompresja obrazu do spełnienia wymagań dotyczących rozmiaru pliku
-        webp_image = io.BytesIO()
-        quality = 100
-        img_copy.save(webp_image, format="WEBP", quality=quality)
-        while webp_image.tell() > max_size_kb * 1024 and quality > 0:
-            quality -= 5
-            webp_image = io.BytesIO()
-            img_copy.save(webp_image, format="WEBP", quality=quality)
-        results[size] = webp_image.getvalue()
+            faces = detect_faces(frame, cache_key=source_hash, backend=detector)
+            highlighted_image = highlight_faces(frame, faces)
+        encodes = {}
+        results = process_image(
+            highlighted_image,
+            output_sizes,
+            encodes=encodes,
+            cache_key=("highlighted", source_hash, detector),
+            effort=effort,
+            resampler=resampler,
+            original_size=decode_report.original_size,
+        )
+    records = recorder.records if recorder is not None else None
+    return results, encodes, decode_report, records
+
+
+def show_metrics(records, log=True):
+    # Tabela czasów etapów w interfejsie + zapis JSON lines do logów
+    if records:
+        if log:
+            write_jsonl(records)
+        st.dataframe(summarize(records))
+
+
+def show_result(item):
+    results, encodes, decode_report, records, preview = item.value
+    st.write(f"Przetworzono: {item.name}")
+    if decode_report and decode_report.saved_bytes:
+        st.caption(decode_report.summary())
+    st.image(preview.path, caption="Podgląd")
+    # Wyniki zadań to uchwyty do plików - bajty czytane dopiero po kliknięciu
+    for size, handle in results.items():
+        st.download_button(
+            label=f"Pobierz {size}",
+            data=handle.read,
+            file_name=f"{os.path.splitext(item.name)[0]}_{size}.webp",
+            mime="image/webp",
+        )
+    st.write("---")
 
-    return results
+
+def show_summary(job):
+    succeeded = job.succeeded()
+    processed = job.processed()
+    total_encodes = sum(sum(item.value[1].values()) for item in processed)
+    st.success(
+        f"Przetworzono {len(succeeded)} z {job.total} plików w {job.seconds:.2f} sekund (kodowań: {total_encodes})."
+    )
+    st.caption(result_cache.summary())
+    st.caption(admission.summary())
+    if dedup_summary(job):
+        st.caption(dedup_summary(job))
+    records = [record for item in processed for record in item.value[3] or []]
+    # Logi zapisujemy raz na zadanie, nie przy każdym ponownym wyświetleniu
+    show_metrics(records, log=job.claim("metrics"))
+
+    def banner_zip():
+        # Paczka składana dopiero po kliknięciu, nie przy każdym rysowaniu;
+        # Streamlit dostaje strumień z pliku tymczasowego, nie kopię w bajtach
+        with ZipSpool() as zf:
+            for item in succeeded:
+                results = item.value[0]
+                if "Banner" in results:
+                    zf.write(
+                        results["Banner"].path,
+                        f"{os.path.splitext(item.name)[0]}_Banner.webp",
+                    )
+            return zf.detach()
+
+    if succeeded:
+        st.download_button(
+            label="Pobierz wszystkie zdjęcia (1200x500)",
+            data=banner_zip,
+            file_name="processed_images.zip",
+            mime="application/zip",
+        )
+
+
+def detector_select(mode, allow_none=True):
+    # Backend detekcji wybierany osobno w każdym trybie; "none" tylko tam,
+    # gdzie wystarczą same przeskalowane pliki
+    options = [
+        name for name in available_backends() if allow_none or name != "none"
+    ] or [DEFAULT_BACKEND]
+    index = options.index(DEFAULT_BACKEND) if DEFAULT_BACKEND in options else 0
+    return st.selectbox(
+        "Detektor twarzy",
+        options,
+        index=index,
+        format_func=lambda name: DETECTOR_LABELS.get(name, name),
+        key=f"detector_{mode}",
+    )
+
+
+def detector_initializer(detector):
+    # Procesy robocze ładują wybrany backend przed pierwszym plikiem
+    if detector == "none":
+        return None
+    return ("face_detection:warm_up", detector)
 
 
 def main():
@@ -88,89 +282,105 @@ def main():
     }
 
     menu = ["Masowe przetwarzanie", "Pojedyncze zdjęcie", "Zdjęcia z Midjourney"]
-    choice = st.sidebar.selectbox("Wybierz tryb", menu)
+    choice = st.sidebar.selectbox("Wybierz tryb", menu, index=mode_index(menu))
+    metrics = st.sidebar.checkbox("Pokaż czasy etapów", value=bool(LOG_PATH))
+    # Identyczne pliki są łączone zawsze, niemal identyczne na życzenie
+    similar = st.sidebar.checkbox(
+        "Łącz niemal identyczne zdjęcia",
+        value=False,
+        help="Porównanie odcisków miniatur przed przetwarzaniem. Pliki PNG są "
+        "przy tym dekodowane w całości, więc dla dużych PNG to dodatkowy koszt.",
+    )
+    # Podglądy kodowane szybko, pliki do pobrania z presetem wybranym
+    # osobno dla każdego trybu
+    effort = mode_select("Wysiłek kodowania eksportu", PRESETS, "max", choice, "effort")
+    # Metoda skalowania zapamiętywana osobno dla każdego trybu
+    resampler = mode_select(
+        "Metoda skalowania", RESAMPLERS, DEFAULT_RESAMPLER, choice, "resampler"
+    )
 
     if choice == "Masowe przetwarzanie":
         st.header("Masowe przetwarzanie zdjęć")
         st.write(
             "Wybierz pliki, które chcesz przetworzyć. Możesz przesłać wiele plików jednocześnie."
         )
+        detector = detector_select(choice)
         uploaded_files = st.file_uploader(
             "Wybierz pliki", type=["jpg", "png"], accept_multiple_files=True
         )
 
-        if uploaded_files:
-            if st.button("Przetwórz zdjęcia") or st.session_state.get(
-                "bulk_processing", False
-            ):
-                st.session_state.bulk_processing = True
-                progress_bar = st.progress(0)
-                start_time = time.time()
-                processed_count = 0
-                all_files_zip = io.BytesIO()
-
-                with zipfile.ZipFile(all_files_zip, "w", zipfile.ZIP_DEFLATED) as zf:
-                    for i, uploaded_file in enumerate(uploaded_files):
-                        try:
-                            image = Image.open(uploaded_file)
-                            faces = detect_faces(image)
-                            highlighted_image = highlight_faces(image, faces)
-                            results = process_image(highlighted_image, output_sizes)
-
-                            st.write(f"Przetworzono: {uploaded_file.name}")
-                            for size, img_bytes in results.items():
-                                st.download_button(
-                                    label=f"Pobierz {size}",
-                                    data=img_bytes,
-                                    file_name=f"{os.path.splitext(uploaded_file.name)[0]}_{size}.webp",
-                                    mime="image/webp",
-                                )
-                                if size == "Banner":
-                                    zf.writestr(
-                                        f"{os.path.splitext(uploaded_file.name)[0]}_{size}.webp",
-                                        img_bytes,
-                                    )
-                            st.write("---")
-                            processed_count += 1
-                        except Exception as e:
-                            st.error(
-                                f"Błąd podczas przetwarzania {uploaded_file.name}: {str(e)}"
-                            )
-
-                        progress_bar.progress((i + 1) / len(uploaded_files))
-
-                    end_time = time.time()
-                    processing_time = end_time - start_time
-                    st.success(
-                        f"Przetworzono {processed_count} z {len(uploaded_files)} plików w {processing_time:.2f} sekund."
-                    )
-                    st.session_state.bulk_processing = False
+        if uploaded_files and st.button("Przetwórz zdjęcia"):
+            # Pliki trafiają do procesów roboczych jako bajty
+            files = [(f.name, f.getvalue()) for f in uploaded_files]
+            submit_job(
+                choice,
+                "app:process_upload",
+                files,
+                output_sizes,
+                metrics,
+                effort,
+                detector,
+                resampler,
+                initializer=detector_initializer(detector),
+                perceptual=similar,
+                index=upload_index(uploaded_files),
+                lookup=lambda name, data: cached_upload(
+                    name, data, output_sizes, effort, detector, resampler
+                ),
+            )
 
-                    if processed_count > 0:
-                        all_files_zip.seek(0)
-                        st.download_button(
-                            label="Pobierz wszystkie zdjęcia (1200x500)",
-                            data=all_files_zip.getvalue(),
-                            file_name="processed_images.zip",
-                            mime="application/zip",
-                        )
+        job = current_job(choice)
+        if job is not None:
+            show_job(job, show_result, show_summary)
 
     elif choice == "Pojedyncze zdjęcie":
         st.header("Przetwarzanie pojedynczego zdjęcia")
         st.write("Wybierz jedno zdjęcie, które chcesz przetworzyć.")
+        detector = detector_select(choice, allow_none=False)
         uploaded_file = st.file_uploader("Wybierz plik", type=["jpg", "png"])
 
         if uploaded_file:
-            image = Image.open(uploaded_file)
-            faces = detect_faces(image)
+            # Dekodowanie w procesie aplikacji też korzysta z budżetu pikseli
+            cost = footprint(uploaded_file)
+            with recording(
+                uploaded_file.name, metrics
+            ) as recorder, decode_budget.reserve(cost):
+                source_hash = content_hash(uploaded_file.getvalue())
+                image, decode_report = decode_image(uploaded_file, BASE_WIDTH)
+                with st.spinner("Wykrywanie twarzy..."):
+                    faces = detect_faces(image, cache_key=source_hash, backend=detector)
+                highlighted_image = highlight_faces(image, faces)
             st.image(
-                highlight_faces(image, faces),
+                highlighted_image,
                 caption="Oryginalne zdjęcie z zaznaczonymi twarzami",
                 use_column_width=True,
             )
 
             if st.button("Przetwórz"):
-                results = process_image(image, output_sizes)
+                with recording(
+                    uploaded_file.name, metrics
+                ) as process_recorder, decode_budget.reserve(cost):
+                    results = process_image(
+                        image,
+                        output_sizes,
+                        cache_key=source_hash,
+                        effort="fast",
+                        resampler=resampler,
+                        original_size=decode_report.original_size,
+                    )
+                if recorder is not None:
+                    show_metrics(recorder.records + process_recorder.records)
+
+                def export(size):
+                    # Wersja do pobrania liczona dopiero po kliknięciu
+                    return process_image(
+                        image,
+                        output_sizes,
+                        cache_key=source_hash,
+                        effort=effort,
+                        resampler=resampler,
+                        original_size=decode_report.original_size,
+                    )[size]
 
                 cols = st.columns(3)
                 for i, (size, img_bytes) in enumerate(results.items()):
@@ -183,7 +393,7 @@ def main():
                         )
                         st.download_button(
                             label=f"Pobierz {size}",
-                            data=img_bytes,
+                            data=lambda size=size: export(size),
                             file_name=f"{os.path.splitext(uploaded_file.name)[0]}_{size}.webp",
                             mime="image/webp",
                         )
@@ -191,65 +401,40 @@ def main():
     elif choice == "Zdjęcia z Midjourney":
         st.header("Przetwarzanie zdjęć z Midjourney")
         st.write("Wybierz pliki PNG z Midjourney, które chcesz przetworzyć.")
+        detector = detector_select(choice)
         uploaded_files = st.file_uploader(
             "Wybierz pliki PNG z Midjourney", type=["png"], accept_multiple_files=True
         )
 
-        if uploaded_files:
-            if st.button("Przetwórz zdjęcia") or st.session_state.get(
-                "midjourney_processing", False
-            ):
-                st.session_state.midjourney_processing = True
-                progress_bar = st.progress(0)
-                start_time = time.time()
-                processed_count = 0
-                all_files_zip = io.BytesIO()
-
-                with zipfile.ZipFile(all_files_zip, "w", zipfile.ZIP_DEFLATED) as zf:
-                    for i, uploaded_file in enumerate(uploaded_files):
-                        try:
-                            image = Image.open(uploaded_file)
-                            faces = detect_faces(image)
-                            highlighted_image = highlight_faces(image, faces)
-                            results = process_image(highlighted_image, output_sizes)
-
-                            st.write(f"Przetworzono: {uploaded_file.name}")
-                            for size, img_bytes in results.items():
-                                st.download_button(
-                                    label=f"Pobierz {size}",
-                                    data=img_bytes,
-                                    file_name=f"{os.path.splitext(uploaded_file.name)[0]}_{size}.webp",
-                                    mime="image/webp",
-                                )
-                                if size == "Banner":
-                                    zf.writestr(
-                                        f"{os.path.splitext(uploaded_file.name)[0]}_{size}.webp",
-                                        img_bytes,
-                                    )
-                            st.write("---")
-                            processed_count += 1
-                        except Exception as e:
-                            st.error(
-                                f"Błąd podczas przetwarzania {uploaded_file.name}: {str(e)}"
-                            )
-
-                        progress_bar.progress((i + 1) / len(uploaded_files))
-
-                    end_time = time.time()
-                    processing_time = end_time - start_time
-                    st.success(
-                        f"Przetworzono {processed_count} z {len(uploaded_files)} plików w {processing_time:.2f} sekund."
-                    )
-                    st.session_state.midjourney_processing = False
+        if uploaded_files and st.button("Przetwórz zdjęcia"):
+            # Pliki trafiają do procesów roboczych jako bajty
+            files = [(f.name, f.getvalue()) for f in uploaded_files]
+            submit_job(
+                choice,
+                "app:process_upload",
+                files,
+                output_sizes,
+                metrics,
+                effort,
+                detector,
+                resampler,
+                initializer=detector_initializer(detector),
+                perceptual=similar,
+                index=upload_index(uploaded_files),
+                lookup=lambda name, data: cached_upload(
+                    name, data, output_sizes, effort, detector, resampler
+                ),
+            )
 
-                    if processed_count > 0:
-                        all_files_zip.seek(0)
-                        st.download_button(
-                            label="Pobierz wszystkie zdjęcia (1200x500)",
-                            data=all_files_zip.getvalue(),
-                            file_name="processed_images.zip",
-                            mime="application/zip",
-                        )
+        job = current_job(choice)
+        if job is not None:
+            show_job(job, show_result, show_summary)
+
+    # Strona jest już narysowana - detektor wybrany w trybie pojedynczego
+    # zdjęcia może się ładować w tle. Tryby masowe wykrywają twarze
+    # w procesach roboczych, więc proces interfejsu nie trzyma tam modelu.
+    if choice == "Pojedyncze zdjęcie":
+        prewarm(detector)
 
 
 if __name__ == "__main__":
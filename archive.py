@@ -0,0 +1,67 @@
+import io
+import os
+import tempfile
+import zipfile
+
+# Formaty już skompresowane - deflate tylko zużywa CPU, niczego nie oszczędzając
+STORED_EXTENSIONS = {".webp", ".jpg", ".jpeg", ".png", ".avif", ".gif"}
+
+
+def compress_type(name):
+    if os.path.splitext(name)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+class ZipSpool:
+    # Archiwum ZIP budowane przyrostowo w pliku tymczasowym na dysku - każdy
+    # wynik jest dopisywany od razu, bez trzymania całej paczki w pamięci.
+    def __init__(self, directory=None):
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._zip = zipfile.ZipFile(self._file, "w")
+        self._reader = None
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def writestr(self, name, data):
+        self._zip.writestr(name, data, compress_type=compress_type(name))
+        self.count += 1
+
+    def write(self, path, name):
+        # Plik z dysku kopiowany do archiwum strumieniowo, bez wczytywania
+        self._zip.write(path, name, compress_type=compress_type(name))
+        self.count += 1
+
+    def finish(self):
+        # Zamyka katalog ZIP i zwraca strumień plikowy (BufferedReader) gotowy
+        # do przekazania st.download_button zamiast kopii w bajtach
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+            self._file.flush()
+        if self._reader is None:
+            self._reader = io.open(self._file.fileno(), "rb", closefd=False)
+        self._reader.seek(0)
+        return self._reader
+
+    def detach(self):
+        # Jak finish(), ale strumień ma własny deskryptor pliku tymczasowego
+        # i działa także po close() - dla odroczonego st.download_button,
+        # który czyta dane już po wyjściu z funkcji budującej paczkę
+        self.finish()
+        reader = io.open(os.dup(self._file.fileno()), "rb")
+        reader.seek(0)
+        return reader
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+        if self._reader is not None:
+            self._reader.close()
+        self._file.close()
@@ -0,0 +1,234 @@
+import importlib
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, NamedTuple
+
+import admission
+from admission import decode_budget
+
+
+class FileResult(NamedTuple):
+    index: int
+    name: str
+    value: Any
+    error: Exception = None
+
+
+def default_workers():
+    return int(os.environ.get("RESIZER_WORKERS", 0)) or os.cpu_count() or 1
+
+
+def resolve_task(task):
+    # Zadania przekazujemy jako "moduł:funkcja" - funkcji zdefiniowanych w
+    # skrypcie uruchomionym przez Streamlit nie da się zapiklować
+    module_name, func_name = task.split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def run_task(task, name, data, args):
+    return resolve_task(task)(name, data, *args)
+
+
+def run_initializer(initializer, shared=None):
+    # "moduł:funkcja" albo krotka ("moduł:funkcja", argumenty...); shared:
+    # admission.shared_state() procesu głównego - limity wspólne z pulą
+    if shared is not None:
+        admission.attach(shared)
+    if not initializer:
+        return
+    if isinstance(initializer, tuple):
+        task, *args = initializer
+    else:
+        task, args = initializer, ()
+    resolve_task(task)(*args)
+
+
+class BatchEngine:
+    def __init__(self, max_workers=None, mp_context="spawn", initializer=None):
+        self.max_workers = max_workers or default_workers()
+        self.mp_context = mp_context
+        self.initializer = initializer
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.mp_context),
+                    initializer=run_initializer,
+                    initargs=(self.initializer, admission.shared_state()),
+                )
+            return self._executor
+
+    def _reset(self, broken=None):
+        # broken: pula, która padła - inna (już utworzona na jej miejsce)
+        # zostaje, żeby kolejne wyniki ze starej puli jej nie zamknęły
+        with self._lock:
+            if self._executor is not None and broken in (None, self._executor):
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def warm_up(self):
+        # Uruchamia procesy robocze (razem z inicjalizatorem, np. ładowaniem
+        # detektora) przed pierwszym plikiem, a nie przy pierwszym żądaniu
+        if self.max_workers <= 1:
+            if self.initializer:
+                run_initializer(self.initializer)
+            return
+        executor = self._get_executor()
+        for future in [executor.submit(os.getpid) for _ in range(self.max_workers)]:
+            future.result()
+
+    def map(
+        self,
+        task,
+        files,
+        *args,
+        progress=None,
+        lookup=None,
+        max_pending=None,
+        cost=None,
+    ):
+        # files: pary (nazwa, bajty) - lista lub dowolny iterator; wyniki
+        # zwracane w kolejności ukończenia. lookup(nazwa, bajty) pozwala pominąć
+        # pliki, których wynik jest już znany. max_pending ogranicza liczbę
+        # plików jednocześnie przekazanych do puli (stała pamięć dla iteratorów).
+        # cost(nazwa, bajty) - szacunek pamięci pliku; plik trafia do pracy
+        # dopiero po przydziale z budżetu decode_budget wspólnego dla procesu.
+        total = len(files) if hasattr(files, "__len__") else None
+        items = ((index, name, data) for index, (name, data) in enumerate(files))
+        if self.max_workers <= 1 or (total is not None and total <= 1):
+            results = self._map_inline(task, items, args, lookup, cost)
+        else:
+            results = self._map_pool(task, items, args, lookup, max_pending, cost)
+
+        for done, result in enumerate(results, start=1):
+            if progress is not None:
+                progress(done, total)
+            yield result
+
+    def _submit(self, task, name, data, args):
+        # Zgłoszenie do zepsutej puli odtwarza ją i ponawia raz; zwraca
+        # (future, pula), żeby błąd wyniku zamknął właściwą pulę
+        executor = self._get_executor()
+        try:
+            return executor.submit(run_task, task, name, data, args), executor
+        except BrokenProcessPool:
+            self._reset(executor)
+            executor = self._get_executor()
+            return executor.submit(run_task, task, name, data, args), executor
+
+    def _start(self, task, index, name, data, args, units, attempt):
+        # Przydział z budżetu i zgłoszenie do puli; (future, opis) albo
+        # FileResult z błędem, gdy pula nie daje się odtworzyć
+        decode_budget.acquire(units)
+        try:
+            future, executor = self._submit(task, name, data, args)
+        except BrokenProcessPool as e:
+            # Nowa pula też padła (np. inicjalizator zgłasza błąd)
+            decode_budget.release(units)
+            return None, FileResult(index, name, None, e)
+        except BaseException:
+            decode_budget.release(units)
+            raise
+        # Zwolnienie także dla anulowanych - wywołanie przy każdym
+        # zakończeniu future, niezależnie od odbioru wyniku
+        future.add_done_callback(lambda _, units=units: decode_budget.release(units))
+        return future, (index, name, data, units, attempt, executor)
+
+    def _map_pool(self, task, items, args, lookup, max_pending, cost):
+        # Padnięcie procesu roboczego (np. OOM) psuje całą pulę i wszystkie
+        # pliki w toku. Pulę odtwarzamy, a przerwane pliki ponawiamy po
+        # jednym, gdy nic innego nie jest w toku - drugi raz pada już tylko
+        # plik, który ją zabija, i tylko on kończy się błędem.
+        futures = {}
+        retry = deque()
+        exhausted = False
+        try:
+            while True:
+                if retry and not futures:
+                    index, name, data, units = retry.popleft()
+                    future, entry = self._start(task, index, name, data, args, units, 1)
+                    if future is None:
+                        yield entry
+                        continue
+                    futures[future] = entry
+
+                while (
+                    not retry
+                    and not exhausted
+                    and (max_pending is None or len(futures) < max_pending)
+                ):
+                    try:
+                        index, name, data = next(items)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    value = lookup(name, data) if lookup is not None else None
+                    if value is not None:
+                        yield FileResult(index, name, value)
+                        continue
+                    units = cost(name, data) if cost is not None else 0
+                    future, entry = self._start(task, index, name, data, args, units, 0)
+                    if future is None:
+                        yield entry
+                        continue
+                    futures[future] = entry
+
+                if not futures:
+                    if retry:
+                        continue
+                    return
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    index, name, data, units, attempt, executor = futures.pop(future)
+                    try:
+                        yield FileResult(index, name, future.result())
+                    except BrokenProcessPool as e:
+                        self._reset(executor)
+                        if attempt == 0:
+                            retry.append((index, name, data, units))
+                        else:
+                            yield FileResult(index, name, None, e)
+                    except Exception as e:
+                        yield FileResult(index, name, None, e)
+        finally:
+            # Przerwany rerun - nie liczymy plików, których nikt nie odbierze
+            for future in futures:
+                future.cancel()
+
+    def _map_inline(self, task, items, args, lookup, cost):
+        func = resolve_task(task)
+        for index, name, data in items:
+            try:
+                value = lookup(name, data) if lookup is not None else None
+                if value is None:
+                    units = cost(name, data) if cost is not None else 0
+                    with decode_budget.reserve(units):
+                        value = func(name, data, *args)
+                yield FileResult(index, name, value)
+            except Exception as e:
+                yield FileResult(index, name, None, e)
+
+    def shutdown(self):
+        self._reset()
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(max_workers=None, initializer=None):
+    # Pula procesów przeżywa ponowne uruchomienia skryptu Streamlit
+    max_workers = max_workers or default_workers()
+    key = (max_workers, initializer)
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = BatchEngine(max_workers, initializer=initializer)
+        return _engines[key]
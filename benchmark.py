@@ -0,0 +1,792 @@
+import argparse
+import ctypes
+import ctypes.util
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from decode import decode_image
+from face_detection import BACKENDS, get_detector
+from frame import decode_frame
+from pipeline import OUTPUT_SIZES, iter_inputs
+from quality_search import (
+    DEFAULT_EFFORT,
+    PRESETS,
+    QualitySearch,
+    default_search,
+    encode,
+)
+from resampling import DEFAULT_RESAMPLER, RESAMPLERS
+from resize_plan import BASE_WIDTH
+
+RESOLUTIONS = [(800, 600), (1920, 1080), (3840, 2160), (7680, 4320)]
+QUICK_RESOLUTIONS = [(800, 600), (1920, 1080)]
+
+# Zestawy profili odpowiadające trybom obu aplikacji
+PROFILE_SETS = {
+    "app": ("cropped", OUTPUT_SIZES, "WEBP"),
+    "streamlit_app": ("fit", OUTPUT_SIZES, "WEBP"),
+    "custom_webp": ("fit", {"Niestandardowy": (1920, 0, 100)}, "WEBP"),
+    "custom_jpeg": ("fit", {"Niestandardowy": (1920, 0, 100)}, "JPEG"),
+}
+
+# Metryki, dla których większa wartość oznacza regresję
+METRICS = ("seconds", "encodes", "bytes", "peak_rss_mb")
+
+# Progi zgodności metod skalowania z Pillow LANCZOS
+RESAMPLE_REFERENCE = "pillow-lanczos"
+RESAMPLE_PSNR = 35.0
+RESAMPLE_SSIM = 0.97
+# Szerokości docelowe: szerokość bazowa app.py i profile obu aplikacji
+RESAMPLE_WIDTHS = (1920, 1200, 600)
+
+# Cele rozmiaru (KB) i formaty do sprawdzenia wyszukiwania jakości;
+# szerokość obrazów odpowiada profilom aplikacji
+QUALITY_TARGETS = (5, 10, 20, 40, 60, 100, 200)
+QUALITY_FORMATS = ("WEBP", "JPEG")
+QUALITY_WIDTH = 1200
+
+# Moduły, których import nie może spowalniać startu aplikacji
+HEAVY_MODULES = ("cv2", "retinaface", "tensorflow", "torch")
+
+# Pomiar startu w osobnym procesie - za każdym razem zimny import
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"seconds": seconds, "heavy_modules": heavy}}))
+"""
+
+STARTUP_CASES = {
+    "import": "import {module}",
+    "render": (
+        "from streamlit.testing.v1 import AppTest\n"
+        "AppTest.from_file({path!r}, default_timeout=300).run()"
+    ),
+}
+
+
+def install_detector_stub():
+    # Zamiennik RetinaFace do pomiarów offline - jedna twarz na środku kadru
+    class RetinaFace:
+        @staticmethod
+        def build_model():
+            return None
+
+        @staticmethod
+        def detect_faces(img, threshold=0.9, model=None, allow_upscaling=True):
+            height, width = img.shape[:2]
+            return {
+                "face_1": {
+                    "score": 1.0,
+                    "facial_area": [
+                        width * 2 // 5,
+                        height // 3,
+                        width * 3 // 5,
+                        height * 2 // 3,
+                    ],
+                    "landmarks": {},
+                }
+            }
+
+    module = types.ModuleType("retinaface")
+    module.RetinaFace = RetinaFace
+    sys.modules["retinaface"] = module
+
+
+def photo_image(width, height, seed):
+    # Gładkie pole barw z szumem - zachowuje się jak zdjęcie z aparatu
+    rng = np.random.default_rng(seed)
+    base = rng.integers(0, 256, (height // 64 + 2, width // 64 + 2, 3), dtype=np.uint8)
+    image = Image.fromarray(base).resize((width, height), Image.BICUBIC)
+    noise = rng.normal(0, 8, (height, width, 3))
+    pixels = np.clip(np.asarray(image, dtype=np.float32) + noise, 0, 255)
+    return Image.fromarray(pixels.astype(np.uint8))
+
+
+def flat_image(width, height, seed):
+    # Płaskie plamy koloru i ostre krawędzie - jak grafiki z Midjourney
+    rng = np.random.default_rng(seed)
+    image = Image.new("RGB", (width, height), tuple(rng.integers(0, 256, 3).tolist()))
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x0, x1 = sorted(rng.integers(0, width, 2).tolist())
+        y0, y1 = sorted(rng.integers(0, height, 2).tolist())
+        color = tuple(rng.integers(0, 256, 3).tolist())
+        if rng.random() < 0.5:
+            draw.ellipse((x0, y0, x1, y1), fill=color)
+        else:
+            draw.rectangle((x0, y0, x1, y1), fill=color)
+    return image
+
+
+def synthetic_inputs(resolutions, seed=0):
+    for width, height in resolutions:
+        for kind, factory, file_format in (
+            ("photo", photo_image, "JPEG"),
+            ("flat", flat_image, "PNG"),
+        ):
+            output = io.BytesIO()
+            factory(width, height, seed).save(output, format=file_format, quality=92)
+            yield f"{kind}-{width}x{height}", output.getvalue()
+
+
+def release_memory():
+    # Oddaje zwolnioną pamięć do systemu, żeby RSS etapu mierzył tylko ten etap
+    gc.collect()
+    libc_name = ctypes.util.find_library("c")
+    if libc_name:
+        try:
+            ctypes.CDLL(libc_name).malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+
+def current_rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class RssSampler:
+    # Szczytowe RSS w trakcie etapu - próbkowanie /proc/self/statm w tle
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.peak = 0
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.start_rss = current_rss()
+        self.peak = self.start_rss
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+    @property
+    def peak_mb(self):
+        return (self.peak - self.start_rss) / (1024 * 1024)
+
+
+def measure(stages, name, func):
+    release_memory()
+    with RssSampler() as sampler:
+        start = time.perf_counter()
+        value = func()
+        seconds = time.perf_counter() - start
+    stages[name] = {"seconds": seconds, "peak_rss_mb": max(sampler.peak_mb, 0.0)}
+    return value
+
+
+def run_case(profile_set, data, effort=DEFAULT_EFFORT):
+    mode, output_sizes, file_format = PROFILE_SETS[profile_set]
+    stages = {}
+    encodes = {}
+    if mode == "cropped":
+        import app
+
+        frame, report = measure(
+            stages, "decode", lambda: decode_frame(io.BytesIO(data), BASE_WIDTH)
+        )
+        faces = measure(stages, "detect", lambda: app.detect_faces(frame))
+        image = measure(stages, "highlight", lambda: app.highlight_faces(frame, faces))
+        results = measure(
+            stages,
+            "process",
+            lambda: app.process_image(
+                image,
+                output_sizes,
+                encodes=encodes,
+                effort=effort,
+                original_size=report.original_size,
+            ),
+        )
+    else:
+        import streamlit_app
+
+        target_width = streamlit_app.max_width(output_sizes)
+        image, report = measure(
+            stages, "decode", lambda: decode_image(io.BytesIO(data), target_width)
+        )
+        results = measure(
+            stages,
+            "process",
+            lambda: streamlit_app.process_image(
+                image,
+                output_sizes,
+                file_format,
+                encodes=encodes,
+                effort=effort,
+                original_size=report.original_size,
+            ),
+        )
+
+    seconds = sum(stage["seconds"] for stage in stages.values())
+    # Wymiary źródła, nie obrazu po dekodowaniu w zmniejszeniu - inaczej
+    # draft/reduce zawyżałyby przepustowość i psuły porównanie z dawnymi
+    # pomiarami
+    width, height = report.original_size
+    return {
+        "seconds": seconds,
+        # Przepustowość w megapikselach obrazu źródłowego na sekundę
+        "megapixels_per_second": width * height / 1e6 / seconds,
+        "encodes": sum(encodes.values()),
+        "bytes": sum(len(value) for value in results.values()),
+        "peak_rss_mb": max(stage["peak_rss_mb"] for stage in stages.values()),
+        "stages": stages,
+    }
+
+
+def case_name(profile_set, input_name, effort):
+    # Przypadki z domyślnym presetem zachowują dawne nazwy, żeby wcześniejsze
+    # linie bazowe dalej się porównywały
+    suffix = "" if effort == DEFAULT_EFFORT else f"@{effort}"
+    return f"{profile_set}{suffix}/{input_name}"
+
+
+def run(resolutions, profile_sets, repeat=3, efforts=(DEFAULT_EFFORT,)):
+    cases = {}
+    inputs = list(synthetic_inputs(resolutions))
+    for profile_set in profile_sets:
+        for effort in efforts:
+            for input_name, data in inputs:
+                best = None
+                for _ in range(repeat):
+                    # Każde powtórzenie startuje bez wyuczonych jakości
+                    default_search.reset()
+                    result = run_case(profile_set, data, effort)
+                    if best is None or result["seconds"] < best["seconds"]:
+                        best = result
+                name = case_name(profile_set, input_name, effort)
+                cases[name] = best
+                print(
+                    f"{name}: {best['seconds']:.3f} s "
+                    f"({best['megapixels_per_second']:.1f} MP/s), "
+                    f"kodowań: {best['encodes']}, {best['bytes'] // 1024} KB, "
+                    f"RSS +{best['peak_rss_mb']:.1f} MB",
+                    file=sys.stderr,
+                )
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "pillow": Image.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "cases": cases,
+    }
+
+
+def startup_case(module, kind):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{module}.py")
+    statement = STARTUP_CASES[kind].format(module=module, path=path)
+    # Bez ładowania detektora w tle - mierzymy tylko to, na co czeka strona
+    env = {**os.environ, "RESIZER_PREWARM": "0"}
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            STARTUP_SCRIPT.format(statement=statement, heavy=HEAVY_MODULES),
+        ],
+        cwd=os.path.dirname(path),
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_startup(modules, repeat=3):
+    # Czas zimnego importu i pierwszego przebiegu skryptu aplikacji oraz
+    # lista ciężkich modułów załadowanych przed pierwszą interakcją
+    cases = {}
+    for module in modules:
+        for kind in STARTUP_CASES:
+            results = [startup_case(module, kind) for _ in range(repeat)]
+            best = min(results, key=lambda result: result["seconds"])
+            name = f"startup/{module}/{kind}"
+            cases[name] = best
+            print(
+                f"{name}: {best['seconds']:.3f} s, ciężkie moduły: "
+                f"{', '.join(best['heavy_modules']) or 'brak'}",
+                file=sys.stderr,
+            )
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "cases": cases,
+    }
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    overlap = max(x2 - x1, 0) * max(y2 - y1, 0)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - overlap
+    return overlap / union if union > 0 else 0.0
+
+
+def match_faces(reference, faces, threshold=0.5):
+    # Zachłanne parowanie ramek po IoU; wynik: IoU sparowanych ramek
+    pairs = sorted(
+        (
+            (iou(ref["facial_area"], face["facial_area"]), i, j)
+            for i, ref in enumerate(reference.values())
+            for j, face in enumerate(faces.values())
+        ),
+        reverse=True,
+    )
+    used_ref, used_face, matched = set(), set(), []
+    for value, i, j in pairs:
+        if value < threshold:
+            break
+        if i in used_ref or j in used_face:
+            continue
+        used_ref.add(i)
+        used_face.add(j)
+        matched.append(value)
+    return matched
+
+
+def run_detectors(source, backends, reference="retinaface", limit=100):
+    # Przepustowość każdego backendu i zgodność jego ramek z backendem
+    # wzorcowym (domyślnie RetinaFace) na zdjęciach z katalogu source
+    frames = []
+    for path in iter_inputs(source):
+        try:
+            frames.append(decode_frame(path, BASE_WIDTH)[0])
+        except Exception as e:
+            print(f"Pominięto {path}: {e}", file=sys.stderr)
+            continue
+        if len(frames) >= limit:
+            break
+    if not frames:
+        raise SystemExit(f"brak zdjęć w {source}")
+
+    detections = {}
+    cases = {}
+    for backend in [reference] + [name for name in backends if name != reference]:
+        detector = get_detector(backend)
+        # Ładowanie modelu nie wlicza się do czasu detekcji
+        detector.load()
+        start = time.perf_counter()
+        detections[backend] = detector.detect_batch(frames)
+        seconds = time.perf_counter() - start
+        boxes = sum(len(faces) for faces in detections[backend])
+        case = {
+            "seconds": seconds,
+            "images_per_second": len(frames) / seconds,
+            "boxes_per_second": boxes / seconds,
+            "boxes": boxes,
+        }
+        if backend != reference:
+            matched = []
+            reference_boxes = 0
+            for ref_faces, faces in zip(detections[reference], detections[backend]):
+                matched += match_faces(ref_faces, faces)
+                reference_boxes += len(ref_faces)
+            case["recall"] = len(matched) / reference_boxes if reference_boxes else 1.0
+            case["precision"] = len(matched) / boxes if boxes else 1.0
+            case["mean_iou"] = sum(matched) / len(matched) if matched else 0.0
+        name = f"detect/{backend}"
+        cases[name] = case
+        print(
+            f"{name}: {case['images_per_second']:.1f} zdjęć/s, "
+            f"{case['boxes_per_second']:.1f} ramek/s, ramek: {boxes}"
+            + (
+                f", zgodność z {reference}: recall {case['recall']:.2f}, "
+                f"precision {case['precision']:.2f}, IoU {case['mean_iou']:.2f}"
+                if backend != reference
+                else ""
+            ),
+            file=sys.stderr,
+        )
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "images": len(frames),
+            "reference": reference,
+        },
+        "cases": cases,
+    }
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float("inf") if mse == 0 else 10 * np.log10(255.0**2 / mse)
+
+
+def ssim(a, b):
+    # SSIM jasności z oknem gaussowskim 11x11, sigma 1.5 (Wang i in. 2004)
+    import cv2
+
+    def gray(image):
+        return cv2.cvtColor(np.asarray(image.convert("RGB")), cv2.COLOR_RGB2GRAY)
+
+    x, y = gray(a).astype(np.float64), gray(b).astype(np.float64)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+
+    def blur(image):
+        return cv2.GaussianBlur(image, (11, 11), 1.5)
+
+    mu_x, mu_y = blur(x), blur(y)
+    sigma_x = blur(x * x) - mu_x**2
+    sigma_y = blur(y * y) - mu_y**2
+    sigma_xy = blur(x * y) - mu_x * mu_y
+    value = ((2 * mu_x * mu_y + c1) * (2 * sigma_xy + c2)) / (
+        (mu_x**2 + mu_y**2 + c1) * (sigma_x + sigma_y + c2)
+    )
+    return float(value.mean())
+
+
+def run_resample(resolutions, backends, repeat=3):
+    # Każda metoda skalowania na tych samych obrazach: czas, poprawność
+    # wymiarów oraz PSNR/SSIM względem Pillow LANCZOS
+    cases = {}
+    totals = {backend: 0.0 for backend in backends}
+    failures = {backend: [] for backend in backends}
+    # Złe wymiary to błąd każdej metody, nie tylko kompromis jakości
+    size_failures = {backend: [] for backend in backends}
+    for input_name, data in synthetic_inputs(resolutions):
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        for target_width in RESAMPLE_WIDTHS:
+            if target_width >= image.width:
+                continue
+            size = (target_width, int(target_width * image.height / image.width))
+            reference = RESAMPLERS[RESAMPLE_REFERENCE](image, size)
+            for backend in backends:
+                resize = RESAMPLERS[backend]
+                seconds = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    output = resize(image, size)
+                    elapsed = time.perf_counter() - start
+                    seconds = elapsed if seconds is None else min(seconds, elapsed)
+                name = f"resample/{backend}/{input_name}->{size[0]}x{size[1]}"
+                case = {
+                    "seconds": seconds,
+                    "psnr": psnr(np.asarray(output), np.asarray(reference)),
+                    "ssim": ssim(output, reference),
+                }
+                cases[name] = case
+                totals[backend] += seconds
+                if output.size != size:
+                    failures[backend].append(f"{name}: wymiary {output.size}")
+                    size_failures[backend].append(name)
+                elif case["psnr"] < RESAMPLE_PSNR or case["ssim"] < RESAMPLE_SSIM:
+                    failures[backend].append(
+                        f"{name}: PSNR {case['psnr']:.1f} dB, SSIM {case['ssim']:.4f}"
+                    )
+
+    for backend in backends:
+        print(
+            f"{backend}: {totals[backend]:.3f} s łącznie, "
+            f"{'OK' if not failures[backend] else 'poza tolerancją'}",
+            file=sys.stderr,
+        )
+        for failure in failures[backend]:
+            print(f"  {failure}", file=sys.stderr)
+    passing = [backend for backend in backends if not failures[backend]]
+    fastest = min(passing, key=totals.get) if passing else None
+    print(f"Najszybsza metoda w tolerancji: {fastest}", file=sys.stderr)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "pillow": Image.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "reference": RESAMPLE_REFERENCE,
+            "psnr_threshold": RESAMPLE_PSNR,
+            "ssim_threshold": RESAMPLE_SSIM,
+            "fastest_within_tolerance": fastest,
+            "failures": failures,
+            "size_failures": size_failures,
+        },
+        "cases": cases,
+    }
+
+
+def linear_quality(image, max_size_kb, file_format, preset, step):
+    # Dawna pętla: od 100 w dół co step, aż wynik zmieści się w limicie
+    quality = 100
+    data = encode(image, file_format, quality, preset)
+    while len(data) > max_size_kb * 1024 and quality > 0:
+        quality -= step
+        data = encode(image, file_format, quality, preset)
+    return quality, len(data)
+
+
+def run_quality(resolutions, efforts):
+    # Wyszukiwanie jakości każdego presetu względem liniowego przejścia
+    # siatki z tymi samymi ustawieniami kodera. Wynik może różnić się
+    # najwyżej o jeden krok siatki i nie może być większy od liniowego.
+    cases = {}
+    failures = {effort: [] for effort in efforts}
+    for input_name, data in synthetic_inputs(resolutions):
+        image = Image.open(io.BytesIO(data)).convert("RGB")
+        height = int(QUALITY_WIDTH * image.height / image.width)
+        image = image.resize((QUALITY_WIDTH, height), Image.LANCZOS)
+        # Jedna wyszukiwarka na obraz - podpowiedzi przechodzą między
+        # celami jak między kolejnymi zdjęciami w aplikacji
+        search = QualitySearch()
+        for effort in efforts:
+            preset = PRESETS[effort]
+            for file_format in QUALITY_FORMATS:
+                for max_size_kb in QUALITY_TARGETS:
+                    quality, size = linear_quality(
+                        image, max_size_kb, file_format, preset, search.step
+                    )
+                    result = search.search(
+                        image,
+                        max_size_kb,
+                        file_format,
+                        (file_format, max_size_kb),
+                        effort=effort,
+                    )
+                    name = (
+                        f"quality/{effort}/{input_name}/{file_format}-{max_size_kb}kb"
+                    )
+                    cases[name] = {
+                        "quality": result.quality,
+                        "linear_quality": quality,
+                        "encodes": result.encodes,
+                        "bytes": len(result.data),
+                    }
+                    if (
+                        abs(result.quality - quality) > search.step
+                        or len(result.data) > size
+                    ):
+                        failures[effort].append(
+                            f"{name}: jakość {result.quality}, liniowo {quality}"
+                        )
+
+    for effort in efforts:
+        print(
+            f"{effort}: {'OK' if not failures[effort] else 'poza krokiem siatki'}",
+            file=sys.stderr,
+        )
+        for failure in failures[effort]:
+            print(f"  {failure}", file=sys.stderr)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "pillow": Image.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "failures": failures,
+        },
+        "cases": cases,
+    }
+
+
+def write_report(report, path):
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if path == "-":
+        print(output)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+
+def compare(baseline, current, threshold=0.1, time_threshold=0.25, min_seconds=0.01):
+    # Wynik: (regresje, przypadki linii bazowej nieobecne w bieżącym pomiarze)
+    regressions = []
+    missing = []
+
+    def check(name, old_metrics, new_metrics):
+        for metric in METRICS:
+            old, new = old_metrics.get(metric), new_metrics.get(metric)
+            if old is None or new is None:
+                continue
+            # Bardzo krótkich czasów nie porównujemy - to tylko szum pomiaru
+            if metric == "seconds" and max(old, new) < min_seconds:
+                continue
+            limit = (
+                time_threshold if metric in ("seconds", "peak_rss_mb") else threshold
+            )
+            if new > old * (1 + limit):
+                regressions.append((name, metric, old, new))
+
+    for name, base_case in baseline["cases"].items():
+        case = current["cases"].get(name)
+        if case is None:
+            missing.append(name)
+            continue
+        check(name, base_case, case)
+        for stage, base_stage in base_case.get("stages", {}).items():
+            if stage in case.get("stages", {}):
+                check(f"{name}:{stage}", base_stage, case["stages"][stage])
+    return regressions, missing
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark potoku skalowania.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="uruchom pomiary i zapisz JSON")
+    run_parser.add_argument("--out", default="-")
+    run_parser.add_argument("--quick", action="store_true")
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument(
+        "--profile-set", action="append", choices=sorted(PROFILE_SETS)
+    )
+    run_parser.add_argument(
+        "--effort",
+        action="append",
+        choices=list(PRESETS),
+        help="preset kodera (domyślnie wszystkie)",
+    )
+    run_parser.add_argument(
+        "--detector", choices=["stub", "retinaface"], default="stub"
+    )
+
+    startup_parser = commands.add_parser(
+        "startup", help="zmierz czas startu aplikacji i zapisz JSON"
+    )
+    startup_parser.add_argument("--out", default="-")
+    startup_parser.add_argument("--repeat", type=int, default=3)
+    startup_parser.add_argument(
+        "--module", action="append", choices=["app", "streamlit_app"]
+    )
+
+    resample_parser = commands.add_parser(
+        "resample", help="porównaj metody skalowania (czas, PSNR, SSIM)"
+    )
+    resample_parser.add_argument("--out", default="-")
+    resample_parser.add_argument("--quick", action="store_true")
+    resample_parser.add_argument("--repeat", type=int, default=3)
+    resample_parser.add_argument("--backend", action="append", choices=list(RESAMPLERS))
+
+    quality_parser = commands.add_parser(
+        "quality", help="porównaj wyszukiwanie jakości z przejściem liniowym"
+    )
+    quality_parser.add_argument("--out", default="-")
+    quality_parser.add_argument("--quick", action="store_true")
+    quality_parser.add_argument("--effort", action="append", choices=list(PRESETS))
+
+    detect_parser = commands.add_parser(
+        "detectors", help="porównaj backendy detekcji twarzy z wzorcowym"
+    )
+    detect_parser.add_argument("source", help="katalog lub wzorzec glob ze zdjęciami")
+    detect_parser.add_argument("--out", default="-")
+    detect_parser.add_argument(
+        "--backend",
+        action="append",
+        choices=[name for name in BACKENDS if name != "none"],
+        help="domyślnie wszystkie dostępne",
+    )
+    detect_parser.add_argument("--reference", default="retinaface")
+    detect_parser.add_argument("--limit", type=int, default=100)
+
+    compare_parser = commands.add_parser("compare", help="porównaj z linią bazową")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+    compare_parser.add_argument("--time-threshold", type=float, default=0.25)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        if args.detector == "stub":
+            install_detector_stub()
+        resolutions = QUICK_RESOLUTIONS if args.quick else RESOLUTIONS
+        report = run(
+            resolutions,
+            args.profile_set or list(PROFILE_SETS),
+            args.repeat,
+            args.effort or list(PRESETS),
+        )
+        write_report(report, args.out)
+        return 0
+
+    if args.command == "startup":
+        report = run_startup(args.module or ["app", "streamlit_app"], args.repeat)
+        write_report(report, args.out)
+        # Ciężki moduł załadowany przy starcie to regresja niezależnie od czasu
+        return (
+            1 if any(case["heavy_modules"] for case in report["cases"].values()) else 0
+        )
+
+    if args.command == "resample":
+        resolutions = QUICK_RESOLUTIONS if args.quick else RESOLUTIONS
+        # Domyślna metoda aplikacji jest sprawdzana zawsze - także przy
+        # jawnie wybranych --backend
+        backends = args.backend or list(RESAMPLERS)
+        if DEFAULT_RESAMPLER not in backends:
+            backends.append(DEFAULT_RESAMPLER)
+        report = run_resample(resolutions, backends, args.repeat)
+        write_report(report, args.out)
+        # Błąd: domyślna lub jawnie wybrana metoda poza tolerancją PSNR/SSIM
+        # albo dowolna metoda ze złymi wymiarami wyniku
+        failures = report["meta"]["failures"]
+        required = {DEFAULT_RESAMPLER, *(args.backend or [])}
+        failed = [name for name in required if failures[name]] + [
+            name for name, cases in report["meta"]["size_failures"].items() if cases
+        ]
+        if failed:
+            print(f"Niezaliczone: {', '.join(sorted(set(failed)))}", file=sys.stderr)
+        return 1 if failed else 0
+
+    if args.command == "quality":
+        resolutions = QUICK_RESOLUTIONS if args.quick else RESOLUTIONS
+        report = run_quality(resolutions, args.effort or list(PRESETS))
+        write_report(report, args.out)
+        return 1 if any(report["meta"]["failures"].values()) else 0
+
+    if args.command == "detectors":
+        backends = args.backend or [
+            name
+            for name, backend in BACKENDS.items()
+            if name != "none" and backend.available()
+        ]
+        report = run_detectors(args.source, backends, args.reference, args.limit)
+        write_report(report, args.out)
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    regressions, missing = compare(
+        baseline, current, args.threshold, args.time_threshold
+    )
+    for name, metric, old, new in regressions:
+        print(f"REGRESJA {name} {metric}: {old:.3f} -> {new:.3f}")
+    # Brakujący przypadek nie jest regresją (np. --quick wobec pełnej linii
+    # bazowej), ale nie może zniknąć z raportu bez śladu
+    for name in missing:
+        print(f"BRAK {name}: nie zmierzono w bieżącym przebiegu")
+    if not regressions:
+        print("Brak regresji.")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
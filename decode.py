@@ -0,0 +1,70 @@
+import math
+from typing import NamedTuple
+
+from PIL import Image
+
+from instrumentation import span
+
+
+class DecodeReport(NamedTuple):
+    original_size: tuple
+    decoded_size: tuple
+    method: str
+    saved_bytes: int
+
+    @property
+    def saved_mb(self):
+        return self.saved_bytes / (1024 * 1024)
+
+    def summary(self):
+        return (
+            f"Dekodowanie {self.decoded_size[0]}x{self.decoded_size[1]} zamiast "
+            f"{self.original_size[0]}x{self.original_size[1]} ({self.method}), "
+            f"zaoszczędzono {self.saved_mb:.1f} MB pamięci"
+        )
+
+
+def decode_image(fp, target_width, reducing_gap=2.0):
+    with span("decode") as stage:
+        image, report = _decode(fp, target_width, reducing_gap)
+        width, height = report.decoded_size
+        stage.set(
+            bytes=width * height * len(image.getbands()),
+            size=f"{width}x{height}",
+            method=report.method,
+        )
+    return image, report
+
+
+def _decode(fp, target_width, reducing_gap):
+    # Dekoduje obraz od razu do najmniejszej rozdzielczości, która wciąż ma
+    # co najmniej reducing_gap * target_width pikseli szerokości - tak samo
+    # jak Image.thumbnail(), więc końcowy LANCZOS zachowuje jakość.
+    image = Image.open(fp)
+    original_size = image.size
+    bands = len(image.getbands())
+    width, height = original_size
+    min_width = math.ceil(target_width * reducing_gap)
+    method = "full"
+
+    if image.format == "JPEG" and width > min_width:
+        # Skalowanie DCT w dekoderze libjpeg (1/2, 1/4, 1/8)
+        min_height = math.ceil(min_width * height / width)
+        image.draft(image.mode, (min_width, min_height))
+        image.load()
+        if image.size != original_size:
+            method = "draft"
+    else:
+        image.load()
+        factor = width // min_width
+        if factor >= 2:
+            reduced = image.reduce(factor)
+            reduced.format = image.format
+            image.close()
+            image = reduced
+            method = "reduce"
+
+    decoded_width, decoded_height = image.size
+    saved_bytes = (width * height - decoded_width * decoded_height) * bands
+    report = DecodeReport(original_size, image.size, method, saved_bytes)
+    return image, report
@@ -0,0 +1,96 @@
+import io
+import os
+
+from PIL import Image
+
+from admission import decode_budget, footprint
+from result_cache import content_hash
+
+# Rozmiar odcisku dHash (HASH_SIZE x HASH_SIZE bitów) i największa liczba
+# różniących się bitów, przy której zdjęcia uznajemy za te same
+HASH_SIZE = 8
+DISTANCE = int(os.environ.get("RESIZER_DEDUP_DISTANCE", 4))
+
+# Dopuszczalna względna różnica proporcji obrazów w jednej grupie - dHash
+# pomija proporcje, a od nich zależą wymiary wyników
+ASPECT_TOLERANCE = 0.01
+
+
+def perceptual_hash(data):
+    # dHash z miniatury 9x8 w skali szarości. JPEG dekodowany jest od razu
+    # w zmniejszeniu DCT (draft), więc koszt nie zależy od rozdzielczości.
+    # PNG i inne formaty dekoder zawsze rozpakowuje w całości - dlatego
+    # pod budżetem pikseli, jak zwykłe przetwarzanie, a przed konwersją do
+    # skali szarości obraz jest zmniejszany przez reduce(), żeby nie
+    # trzymać drugiej pełnej kopii. Wynik: (rozmiar oryginału, odcisk)
+    # albo None dla uszkodzonego pliku.
+    try:
+        with decode_budget.reserve(footprint(data)), Image.open(
+            io.BytesIO(data)
+        ) as image:
+            size = image.size
+            image.draft("L", (HASH_SIZE * 4, HASH_SIZE * 4))
+            factor = min(image.size) // (HASH_SIZE * 4)
+            reduced = image.reduce(factor) if factor >= 2 else image
+            small = reduced.convert("L").resize(
+                (HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR
+            )
+    except Exception:
+        return None
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            right = pixels[row * (HASH_SIZE + 1) + col + 1]
+            bits = bits << 1 | (left < right)
+    return size, bits
+
+
+def _similar(a, b, distance):
+    (width_a, height_a), bits_a = a
+    (width_b, height_b), bits_b = b
+    aspect_a, aspect_b = width_a * height_b, width_b * height_a
+    if abs(aspect_a - aspect_b) > ASPECT_TOLERANCE * max(aspect_a, aspect_b):
+        return False
+    return bin(bits_a ^ bits_b).count("1") <= distance
+
+
+def group(files, perceptual=False, distance=DISTANCE):
+    # files: [(nazwa, bajty)]; wynik: lista grup indeksów w kolejności
+    # przesłania, pierwszy indeks grupy to plik, który zostanie przetworzony.
+    # Zawsze łączymy pliki o identycznej treści; perceptual=True łączy też
+    # zdjęcia różniące się tylko metadanymi lub kompresją - reprezentantem
+    # jest wtedy wersja o największej rozdzielczości. Dla PNG to kosztowne:
+    # każdy plik jest raz dekodowany w całości (zob. perceptual_hash).
+    exact = {}
+    for index, (name, data) in enumerate(files):
+        exact.setdefault(content_hash(data), []).append(index)
+    groups = list(exact.values())
+    if not perceptual or len(groups) < 2:
+        return groups
+
+    merged = []
+    for members in groups:
+        fingerprint = perceptual_hash(files[members[0]][1])
+        for cluster in merged:
+            if None not in (cluster[0], fingerprint) and _similar(
+                cluster[0], fingerprint, distance
+            ):
+                cluster[1].append((fingerprint, members))
+                break
+        else:
+            merged.append((fingerprint, [(fingerprint, members)]))
+
+    result = []
+    for _, entries in merged:
+        # Reprezentant: największy obraz, przy remisie pierwszy przesłany
+        entries.sort(
+            key=lambda entry: (
+                -(entry[0][0][0] * entry[0][0][1]) if entry[0] else 0,
+                entry[1][0],
+            )
+        )
+        indices = [index for _, members in entries for index in members]
+        result.append([indices[0]] + sorted(indices[1:]))
+    return sorted(result, key=min)
@@ -0,0 +1,90 @@
+import contextvars
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from PIL import features
+
+from quality_search import default_search
+
+BASE_FORMATS = ["WEBP", "JPEG", "PNG"]
+
+
+class EncodeTask(NamedTuple):
+    image: object
+    max_size_kb: int
+    file_format: str
+    profile_key: tuple
+    effort: str = None
+
+
+def supported_formats():
+    # AVIF tylko wtedy, gdy lokalny Pillow ma wkompilowany libavif
+    return BASE_FORMATS + (["AVIF"] if features.check("avif") else [])
+
+
+def default_threads():
+    # W procesach roboczych puli wsadowej równoległość daje już sama pula,
+    # więc tam kodujemy sekwencyjnie, żeby nie przeciążać rdzeni
+    if multiprocessing.parent_process() is not None:
+        return 1
+    return int(os.environ.get("RESIZER_ENCODE_THREADS", 0)) or os.cpu_count() or 1
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=default_threads(), thread_name_prefix="resizer-encode"
+            )
+        return _executor
+
+
+def _search(search, task):
+    return search.search(
+        task.image,
+        task.max_size_kb,
+        task.file_format,
+        task.profile_key,
+        effort=task.effort,
+    )
+
+
+def _own_images(tasks):
+    # Image.save() zapisuje parametry kodera w atrybutach obrazu
+    # (encoderinfo), więc równoległe zapisy tego samego obiektu mieszają
+    # jakości. Pierwsze zadanie korzysta z obrazu wywołującego, kolejne
+    # zadania na tym samym obrazie (np. kilka formatów jednego profilu)
+    # dostają kopię przez publiczne Image.copy().
+    seen = set()
+    owned = {}
+    for key, task in tasks.items():
+        if id(task.image) in seen:
+            task = task._replace(image=task.image.copy())
+        else:
+            seen.add(id(task.image))
+        owned[key] = task
+    return owned
+
+
+def encode_all(tasks, search=default_search):
+    # tasks: {klucz: EncodeTask}; wynik: {klucz: SearchResult} w tej samej
+    # kolejności. Kodery Pillow zwalniają GIL, więc wyszukiwania jakości dla
+    # różnych profili i formatów nakładają się w wątkach. Każde zadanie
+    # dostaje kopię kontekstu, żeby pomiary trafiały do bieżącego rejestratora.
+    if len(tasks) <= 1 or default_threads() <= 1:
+        return {key: _search(search, task) for key, task in tasks.items()}
+
+    executor = get_executor()
+    futures = {
+        key: executor.submit(contextvars.copy_context().run, _search, search, task)
+        for key, task in _own_images(tasks).items()
+    }
+    return {key: future.result() for key, future in futures.items()}
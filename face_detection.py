@@ -0,0 +1,326 @@
+import importlib
+import importlib.util
+import os
+import sys
+import threading
+
+import numpy as np
+from PIL import Image
+
+from frame import Frame
+
+# Backend używany, gdy tryb nie wskazuje innego
+DEFAULT_BACKEND = os.environ.get("RESIZER_DETECTOR", "retinaface")
+
+
+def _face(box, score, landmarks=None):
+    # Jedna twarz w formacie wyniku RetinaFace
+    x1, y1, x2, y2 = (int(round(float(v))) for v in box)
+    return {
+        "score": float(score),
+        "facial_area": [x1, y1, x2, y2],
+        "landmarks": landmarks or {},
+    }
+
+
+def _faces(faces):
+    return {f"face_{i}": face for i, face in enumerate(faces, start=1)}
+
+
+class FaceDetector:
+    # Wspólna część backendów: model ładowany raz na proces (lub proces
+    # roboczy) przy pierwszym użyciu, detekcja na pomniejszonej kopii, ramki
+    # przeliczane na współrzędne oryginału. Wynik w formacie RetinaFace:
+    # {"face_1": {"score", "facial_area": [x1, y1, x2, y2], "landmarks"}}.
+    name = None
+    requires = ()
+
+    def __init__(self, max_side=1024, threshold=0.9):
+        self.max_side = max_side
+        self.threshold = threshold
+        self._model = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def available(cls):
+        # Sprawdzenie bez importu - pakiety ML importujemy dopiero w load()
+        return all(
+            name in sys.modules or importlib.util.find_spec(name) is not None
+            for name in cls.requires
+        )
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def load(self):
+        with self._lock:
+            if self._model is None:
+                self._model = self._load()
+        return self._model
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _detect(self, model, img_array):
+        raise NotImplementedError
+
+    def _prepare(self, image):
+        if isinstance(image, Frame):
+            return self._prepare_frame(image)
+        scale = min(1.0, self.max_side / max(image.size))
+        small = image if image.mode == "RGB" else image.convert("RGB")
+        if scale < 1.0:
+            small = small.resize(
+                (round(image.width * scale), round(image.height * scale)),
+                Image.BILINEAR,
+            )
+        return np.asarray(small), scale
+
+    def _prepare_frame(self, frame):
+        # Klatka mieszcząca się w max_side trafia do modelu jako widok
+        # bufora; większa jest pomniejszana prosto z obrazu PIL klatki
+        scale = min(1.0, self.max_side / max(frame.size))
+        if scale == 1.0:
+            return frame.rgb, scale
+        width, height = frame.size
+        small = frame.image.resize(
+            (round(width * scale), round(height * scale)), Image.BILINEAR
+        )
+        return np.asarray(small)[..., :3], scale
+
+    def _map_back(self, faces, scale):
+        # RetinaFace zwraca pustą krotkę, gdy nie znajdzie twarzy
+        if not isinstance(faces, dict):
+            return {}
+        if scale == 1.0:
+            return faces
+        for face in faces.values():
+            face["facial_area"] = [int(v / scale) for v in face["facial_area"]]
+            if "landmarks" in face:
+                face["landmarks"] = {
+                    name: [v / scale for v in point]
+                    for name, point in face["landmarks"].items()
+                }
+        return faces
+
+    def detect(self, image):
+        return self.detect_batch([image])[0]
+
+    def detect_batch(self, images):
+        model = self.load()
+        results = []
+        for image in images:
+            img_array, scale = self._prepare(image)
+            faces = self._detect(model, img_array)
+            results.append(self._map_back(faces, scale))
+        return results
+
+
+class RetinaFaceDetector(FaceDetector):
+    # Najdokładniejszy, ale najwolniejszy na CPU; pakiet retinaface (a z nim
+    # TensorFlow) importujemy dopiero w load()
+    name = "retinaface"
+    requires = ("retinaface",)
+
+    def _load(self):
+        self._backend = importlib.import_module("retinaface").RetinaFace
+        model = self._backend.build_model()
+        # Rozgrzewka - pierwszy przebieg buduje graf TensorFlow
+        self._backend.detect_faces(np.zeros((64, 64, 3), dtype=np.uint8), model=model)
+        return model
+
+    def _detect(self, model, img_array):
+        return self._backend.detect_faces(
+            img_array, threshold=self.threshold, model=model
+        )
+
+
+class HaarCascadeDetector(FaceDetector):
+    # Kaskada Haara dołączona do opencv-python-headless - bardzo szybka,
+    # bez ocen pewności i z większą liczbą fałszywych trafień
+    name = "opencv"
+    requires = ("cv2",)
+    cascade = "haarcascade_frontalface_default.xml"
+
+    def __init__(self, max_side=640, threshold=0.9):
+        super().__init__(max_side, threshold)
+
+    @classmethod
+    def available(cls):
+        # Plik kaskady szukany obok pakietu cv2, bez jego importowania
+        spec = importlib.util.find_spec("cv2")
+        if spec is None or spec.origin is None:
+            return False
+        data = os.path.join(os.path.dirname(spec.origin), "data")
+        return os.path.exists(os.path.join(data, cls.cascade))
+
+    def _load(self):
+        self._cv2 = importlib.import_module("cv2")
+        model = self._cv2.CascadeClassifier(
+            os.path.join(self._cv2.data.haarcascades, self.cascade)
+        )
+        if model.empty():
+            raise RuntimeError(f"nie można wczytać kaskady {self.cascade}")
+        return model
+
+    def _detect(self, model, img_array):
+        gray = self._cv2.cvtColor(
+            np.ascontiguousarray(img_array), self._cv2.COLOR_RGB2GRAY
+        )
+        boxes = model.detectMultiScale(
+            gray, scaleFactor=1.1, minNeighbors=5, minSize=(24, 24)
+        )
+        return _faces(_face((x, y, x + w, y + h), 1.0) for x, y, w, h in boxes)
+
+
+class YuNetDetector(FaceDetector):
+    # Sieć YuNet przez cv2.FaceDetectorYN; plik modelu ONNX nie jest
+    # częścią pakietu OpenCV - ścieżka w RESIZER_YUNET_MODEL
+    name = "opencv-dnn"
+    requires = ("cv2",)
+    landmark_names = ("right_eye", "left_eye", "nose", "mouth_right", "mouth_left")
+
+    def __init__(self, max_side=640, threshold=0.9):
+        super().__init__(max_side, threshold)
+
+    @staticmethod
+    def model_path():
+        return os.environ.get("RESIZER_YUNET_MODEL", "")
+
+    @classmethod
+    def available(cls):
+        return super().available() and os.path.isfile(cls.model_path())
+
+    def _load(self):
+        self._cv2 = importlib.import_module("cv2")
+        return self._cv2.FaceDetectorYN.create(
+            self.model_path(), "", (320, 320), self.threshold
+        )
+
+    def _detect(self, model, img_array):
+        height, width = img_array.shape[:2]
+        with self._lock:
+            # Rozmiar wejścia jest stanem modelu - jedna detekcja naraz
+            model.setInputSize((width, height))
+            _, rows = model.detect(
+                self._cv2.cvtColor(
+                    np.ascontiguousarray(img_array), self._cv2.COLOR_RGB2BGR
+                )
+            )
+        if rows is None:
+            return {}
+        faces = []
+        for row in rows:
+            x, y, w, h = row[:4]
+            landmarks = {
+                name: [float(row[4 + 2 * i]), float(row[5 + 2 * i])]
+                for i, name in enumerate(self.landmark_names)
+            }
+            faces.append(_face((x, y, x + w, y + h), row[14], landmarks))
+        return _faces(faces)
+
+
+class MTCNNDetector(FaceDetector):
+    # MTCNN z facenet-pytorch - kompromis między kaskadą a RetinaFace
+    name = "mtcnn"
+    requires = ("facenet_pytorch",)
+    landmark_names = ("left_eye", "right_eye", "nose", "mouth_left", "mouth_right")
+
+    def _load(self):
+        mtcnn = importlib.import_module("facenet_pytorch").MTCNN
+        model = mtcnn(keep_all=True, device="cpu")
+        model.detect(np.zeros((64, 64, 3), dtype=np.uint8))
+        return model
+
+    def _detect(self, model, img_array):
+        boxes, scores, points = model.detect(img_array, landmarks=True)
+        if boxes is None:
+            return {}
+        return _faces(
+            _face(box, score, dict(zip(self.landmark_names, point.tolist())))
+            for box, score, point in zip(boxes, scores, points)
+            if score >= self.threshold
+        )
+
+
+class NullDetector(FaceDetector):
+    # Detekcja wyłączona - tryby masowe, którym wystarczą przeskalowane pliki
+    name = "none"
+
+    def _load(self):
+        return True
+
+    def detect_batch(self, images):
+        return [{} for _ in images]
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (
+        RetinaFaceDetector,
+        HaarCascadeDetector,
+        YuNetDetector,
+        MTCNNDetector,
+        NullDetector,
+    )
+}
+
+
+def available_backends():
+    return [name for name, backend in BACKENDS.items() if backend.available()]
+
+
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+
+def get_detector(backend=None):
+    # Jedna instancja backendu na proces - model ładowany tylko raz
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"nieznany detektor: {backend}")
+    with _detectors_lock:
+        if backend not in _detectors:
+            _detectors[backend] = BACKENDS[backend]()
+        return _detectors[backend]
+
+
+default_detector = get_detector()
+
+
+def warm_up(backend=None):
+    # Inicjalizator procesów roboczych puli wsadowej
+    get_detector(backend).load()
+
+
+_prewarm_threads = {}
+_prewarm_lock = threading.Lock()
+
+
+def prewarm(backend=None):
+    # Ładowanie wskazanego detektora w tle, raz na proces i backend -
+    # wywoływane po narysowaniu strony, żeby pierwsza interakcja nie czekała
+    # na TensorFlow. RESIZER_PREWARM=0 wyłącza (np. przy pomiarach czasu
+    # startu).
+    backend = backend or DEFAULT_BACKEND
+    if os.environ.get("RESIZER_PREWARM", "1") == "0" or backend == "none":
+        return
+    with _prewarm_lock:
+        if backend not in _prewarm_threads:
+            _prewarm_threads[backend] = threading.Thread(
+                target=_prewarm,
+                args=(backend,),
+                name=f"resizer-prewarm-{backend}",
+                daemon=True,
+            )
+            _prewarm_threads[backend].start()
+
+
+def _prewarm(backend):
+    try:
+        importlib.import_module("cv2")
+        get_detector(backend).load()
+    except Exception:
+        # Błąd ładowania zgłosi dopiero pierwsza detekcja
+        pass
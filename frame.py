@@ -0,0 +1,55 @@
+import numpy as np
+from PIL import Image
+
+from decode import decode_image
+
+# Wiersze przenoszone naraz przy wypełnianiu bufora - ogranicza rozmiar
+# tymczasowej kopii, którą tworzy np.asarray() na obrazie PIL
+STRIP_ROWS = 256
+
+
+class Frame:
+    # Jeden ciągły bufor pikseli (wysokość x szerokość x 4) współdzielony
+    # przez NumPy, OpenCV i PIL. Obraz PIL mapuje ten sam bufor (RGBX lub
+    # RGBA - tryby, które Pillow potrafi owinąć bez kopiowania), więc
+    # rysowanie przez OpenCV jest od razu widoczne w obrazie PIL.
+    def __init__(self, size, mode="RGBX"):
+        width, height = size
+        self.mode = mode
+        self.pixels = np.empty((height, width, 4), dtype=np.uint8)
+        # Obraz tylko do odczytu po stronie PIL - operacje PIL zwracają nowe
+        # obrazy, a zapis idzie wyłącznie przez self.pixels
+        self.image = Image.frombuffer(mode, size, self.pixels, "raw", mode, 0, 1)
+
+    @classmethod
+    def from_image(cls, image):
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if image.has_transparency_data else "RGB")
+        frame = cls(image.size, "RGBA" if image.mode == "RGBA" else "RGBX")
+        channels = 4 if image.mode == "RGBA" else 3
+        if channels == 3:
+            frame.pixels[..., 3] = 255
+        width, height = image.size
+        for top in range(0, height, STRIP_ROWS):
+            bottom = min(top + STRIP_ROWS, height)
+            strip = np.asarray(image.crop((0, top, width, bottom)))
+            frame.pixels[top:bottom, :, :channels] = strip
+        return frame
+
+    @property
+    def size(self):
+        return self.image.size
+
+    @property
+    def rgb(self):
+        # Widok RGB bez kanału X/A, tylko do odczytu - dla detektora twarzy
+        view = self.pixels[..., :3]
+        view.flags.writeable = False
+        return view
+
+
+def decode_frame(fp, target_width, reducing_gap=2.0):
+    # Dekodowanie (z draft/reduce) i przeniesienie pikseli do klatki;
+    # zdekodowany obraz PIL jest zwalniany od razu po przeniesieniu
+    image, report = decode_image(fp, target_width, reducing_gap)
+    return Frame.from_image(image), report
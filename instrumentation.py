@@ -0,0 +1,126 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Aktywny rejestrator pomiarów dla bieżącego pliku. Gdy nikt nie nagrywa,
+# span() zwraca współdzielony pusty obiekt - koszt to jeden odczyt ContextVar.
+_recorder = contextvars.ContextVar("recorder", default=None)
+_log_lock = threading.Lock()
+
+LOG_PATH = os.environ.get("RESIZER_METRICS_LOG")
+
+
+class Recorder:
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.records = []
+
+    def add(self, stage, seconds=None, profile=None, **fields):
+        record = {"file": self.file_name, "profile": profile, "stage": stage}
+        if seconds is not None:
+            record["seconds"] = seconds
+        record.update(fields)
+        self.records.append(record)
+
+
+class Span:
+    def __init__(self, recorder, stage, profile, fields):
+        self.recorder = recorder
+        self.stage = stage
+        self.profile = profile
+        self.fields = fields
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        self.recorder.add(self.stage, seconds, self.profile, **self.fields)
+
+
+class NullSpan:
+    def set(self, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+def active():
+    return _recorder.get() is not None
+
+
+def span(stage, profile=None, **fields):
+    recorder = _recorder.get()
+    if recorder is None:
+        return NULL_SPAN
+    return Span(recorder, stage, profile, fields)
+
+
+def event(stage, profile=None, **fields):
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.add(stage, None, profile, **fields)
+
+
+@contextmanager
+def recording(file_name, enabled=True):
+    if not enabled:
+        yield None
+        return
+    recorder = Recorder(file_name)
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+def write_jsonl(records, path=None):
+    # Jedna linia JSON na pomiar - format dla potoku logów
+    path = path or LOG_PATH
+    if not path or not records:
+        return
+    timestamp = time.time()
+    lines = "".join(
+        json.dumps({"ts": timestamp, **record}, ensure_ascii=False) + "\n"
+        for record in records
+    )
+    with _log_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(lines)
+
+
+def summarize(records):
+    # Zestawienie etapów do tabeli w interfejsie
+    rows = {}
+    for record in records:
+        key = (record["stage"], record.get("profile") or "")
+        row = rows.setdefault(
+            key,
+            {
+                "etap": key[0],
+                "profil": key[1],
+                "wywołania": 0,
+                "czas [ms]": 0.0,
+                "bajty": 0,
+            },
+        )
+        row["wywołania"] += 1
+        row["czas [ms]"] += record.get("seconds", 0.0) * 1000
+        row["bajty"] += record.get("bytes", 0)
+    for row in rows.values():
+        row["czas [ms]"] = round(row["czas [ms]"], 1)
+    return sorted(rows.values(), key=lambda row: -row["czas [ms]"])
@@ -0,0 +1,166 @@
+import math
+import os
+
+import streamlit as st
+
+from jobs import job_manager
+from metadata import MetadataIndex
+from preview import make_thumbnail
+from result_store import result_store
+
+# Liczba plików rysowanych na jednej stronie listy wyników
+PAGE_SIZE = int(os.environ.get("RESIZER_PAGE_SIZE", 20))
+
+STATE_LABELS = {
+    "queued": "w kolejce",
+    "running": "w toku",
+    "done": "zakończone",
+    "cancelled": "anulowane",
+    "failed": "błąd",
+}
+
+
+def attached_job():
+    # Zadanie wskazane parametrem ?job= w adresie strony - po zamknięciu
+    # i ponownym otwarciu strony wracamy do tego samego zadania
+    job_id = st.query_params.get("job")
+    return job_manager.get(job_id) if job_id else None
+
+
+def mode_index(menu):
+    # Tryb w menu odpowiadający podpiętemu zadaniu (domyślnie pierwszy)
+    job = attached_job()
+    return menu.index(job.mode) if job is not None and job.mode in menu else 0
+
+
+def mode_select(label, options, default, mode, name):
+    # Wybór w pasku bocznym zapamiętywany osobno dla każdego trybu. Streamlit
+    # usuwa stan widżetu, którego nie narysowano w danym przebiegu, więc
+    # wartość trzymamy też pod własnym kluczem - po powrocie do trybu wraca
+    options = list(options)
+    chosen = st.session_state.setdefault(f"{name}_by_mode", {})
+    value = chosen.get(mode, default)
+    chosen[mode] = st.sidebar.selectbox(
+        label,
+        options,
+        index=options.index(value) if value in options else 0,
+        key=f"{name}_{mode}",
+    )
+    return chosen[mode]
+
+
+def spill_results(job_id, item):
+    # Bajty wyników trafiają do magazynu na dysku, w zadaniu zostają uchwyty;
+    # na końcu wartości dokładamy uchwyt miniatury najmniejszego wyniku
+    results, *rest = item.value
+    handles = result_store.put_results(job_id, item.index, results)
+    source = min(handles.values(), key=lambda handle: handle.size)
+    preview = result_store.put(
+        job_id, f"{item.index:05d}-preview", make_thumbnail(source.path)
+    )
+    return (handles, *rest, preview)
+
+
+def upload_index(uploaded_files):
+    # Metadane z nagłówków przesłanych plików, czytane raz na plik (według
+    # file_id) i trzymane w stanie sesji między rerunami
+    index = st.session_state.setdefault("metadata_index", MetadataIndex())
+    return index.update(
+        (getattr(f, "file_id", None) or (f.name, f.size), f) for f in uploaded_files
+    )
+
+
+def dedup_summary(job):
+    # Opis pracy oszczędzonej na duplikatach; None, gdy ich nie było
+    duplicates = job.duplicate_items()
+    if not duplicates:
+        return None
+    saved = sum(sum(item.value[1].values()) for item in duplicates)
+    originals = len({job.duplicates[item.index] for item in duplicates})
+    return (
+        f"Duplikaty: {len(duplicates)} plików otrzymało wyniki {originals} "
+        f"przetworzonych zdjęć (oszczędzono {saved} kodowań)"
+    )
+
+
+def submit_job(mode, task, files, *args, **kwargs):
+    job = job_manager.submit(mode, task, files, *args, spill=spill_results, **kwargs)
+    st.query_params["job"] = job.id
+    return job
+
+
+def current_job(mode):
+    job = attached_job()
+    return job if job is not None and job.mode == mode else None
+
+
+def show_job(job, render_item, render_summary, interval=1.0, page_size=PAGE_SIZE):
+    # Gotowe zadanie rysujemy raz; trwające odświeża fragment co `interval`
+    # sekund, bez ponownego uruchamiania całego skryptu. Wyniki dzielimy na
+    # strony po page_size plików - rysowana jest tylko bieżąca strona.
+    result_store.touch(job.id)
+    if job.done:
+        _show_items(job, render_item, page_size)
+        if job.error is not None:
+            st.error(f"Zadanie {job.id} przerwane: {job.error}")
+        render_summary(job)
+        return
+
+    @st.fragment(run_every=interval)
+    def poll():
+        if job.done:
+            st.rerun()
+        st.progress(
+            job.progress,
+            text=f"Zadanie {job.id}: {len(job.items)} z {job.total} plików "
+            f"({STATE_LABELS[job.state]})",
+        )
+        if st.button("Anuluj zadanie", key=f"cancel_{job.id}"):
+            job.cancel()
+        _show_items(job, render_item, page_size)
+
+    poll()
+
+
+def _turn_page(key, step):
+    st.session_state[key] = st.session_state.get(key, 0) + step
+
+
+def _page(job, pages):
+    # Numer strony trzymany w stanie sesji; przyciski zmieniają go w
+    # wywołaniu zwrotnym, czyli jeszcze przed ponownym rysowaniem listy
+    key = f"page_{job.id}"
+    page = st.session_state[key] = min(st.session_state.get(key, 0), pages - 1)
+    cols = st.columns([1, 2, 1])
+    with cols[0]:
+        st.button(
+            "‹ Poprzednia",
+            key=f"prev_{job.id}",
+            disabled=page == 0,
+            on_click=_turn_page,
+            args=(key, -1),
+        )
+    with cols[1]:
+        st.caption(f"Strona {page + 1} z {pages}")
+    with cols[2]:
+        st.button(
+            "Następna ›",
+            key=f"next_{job.id}",
+            disabled=page >= pages - 1,
+            on_click=_turn_page,
+            args=(key, 1),
+        )
+    return page
+
+
+def _show_items(job, render_item, page_size):
+    # Kolejność przesłania, a nie ukończenia - strony nie przestawiają się
+    # w miarę dopisywania wyników
+    items = sorted(job.items, key=lambda item: item.index)
+    pages = max(math.ceil(len(items) / page_size), 1)
+    page = _page(job, pages) if pages > 1 else 0
+    for item in items[page * page_size : (page + 1) * page_size]:
+        if item.error is not None:
+            st.error(f"Błąd podczas przetwarzania {item.name}: {str(item.error)}")
+        else:
+            render_item(item)
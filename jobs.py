@@ -0,0 +1,211 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import dedup
+from admission import file_cost
+from batch import get_engine
+
+
+class Job:
+    # Stan zadania trzymany poza przebiegiem skryptu Streamlit: wątek w tle
+    # dopisuje wyniki (FileResult), interfejs tylko je odczytuje
+    def __init__(self, job_id, mode, names):
+        self.id = job_id
+        self.mode = mode
+        self.names = names
+        self.total = len(names)
+        self.items = []
+        self.state = "queued"
+        self.error = None
+        # Indeks duplikatu -> indeks pliku, którego wyniki otrzymał
+        self.duplicates = {}
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+        self._claimed = set()
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.state in ("done", "cancelled", "failed")
+
+    @property
+    def progress(self):
+        return len(self.items) / self.total if self.total else 1.0
+
+    @property
+    def seconds(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def succeeded(self):
+        return [item for item in self.items if item.error is None]
+
+    def processed(self):
+        # Wyniki faktycznie policzone - bez kopii dla duplikatów
+        return [item for item in self.succeeded() if item.index not in self.duplicates]
+
+    def duplicate_items(self):
+        return [item for item in self.succeeded() if item.index in self.duplicates]
+
+    def status(self):
+        # Stan każdego pliku w kolejności przesłania
+        states = ["pending"] * self.total
+        for item in list(self.items):
+            states[item.index] = "done" if item.error is None else "error"
+        return list(zip(self.names, states))
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def claim(self, name):
+        # True tylko przy pierwszym wywołaniu - dla efektów ubocznych (np.
+        # zapisu logów), które nie mogą się powtarzać przy każdym rerunie
+        with self._lock:
+            if name in self._claimed:
+                return False
+            self._claimed.add(name)
+            return True
+
+
+class JobManager:
+    # Kolejka zadań wspólna dla wszystkich sesji procesu Streamlit. Zadania
+    # wykonuje wątek w tle, który przekazuje pliki do puli procesów
+    # (BatchEngine); ukończone zadania są usuwane po keep_seconds.
+    def __init__(self, runners=1, keep_seconds=3600, max_jobs=50):
+        self.keep_seconds = keep_seconds
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=runners, thread_name_prefix="resizer-job"
+        )
+
+    def submit(
+        self,
+        mode,
+        task,
+        files,
+        *args,
+        initializer=None,
+        lookup=None,
+        spill=None,
+        perceptual=False,
+        index=None,
+    ):
+        # spill(job_id, item) -> wartość zapisywana w zadaniu zamiast
+        # item.value (np. uchwyty do plików na dysku zamiast bajtów);
+        # perceptual=True łączy też niemal identyczne zdjęcia (dedup.group);
+        # index: metadane.ImageInfo (lub None) dla każdego pliku - z nich
+        # kolejność największy-najpierw i koszt w budżecie pikseli
+        job = Job(uuid.uuid4().hex[:12], mode, [name for name, _ in files])
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._executor.submit(
+            self._run,
+            job,
+            task,
+            list(files),
+            args,
+            initializer,
+            lookup,
+            spill,
+            perceptual,
+            index,
+        )
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            expired = job.done and now - job.finished > self.keep_seconds
+            if expired or (job.done and len(self._jobs) >= self.max_jobs):
+                del self._jobs[job_id]
+
+    def _inputs(self, job, files, groups, costs, units):
+        # Do puli trafia tylko pierwszy plik każdej grupy duplikatów; bajty
+        # zwalniamy zaraz po przekazaniu do puli. units: koszt z indeksu
+        # metadanych według id() bajtów - wpis nadpisywany przed każdym
+        # przekazaniem, więc ponownie użyte id nie zwróci starego kosztu.
+        for members in groups:
+            if job.cancelled:
+                return
+            name, data = files[members[0]]
+            for index in members:
+                files[index] = None
+            if costs:
+                units[id(data)] = costs[members[0]]
+            yield name, data
+
+    def _run(
+        self, job, task, files, args, initializer, lookup, spill, perceptual, index
+    ):
+        job.started = time.time()
+        job.state = "running"
+        try:
+            groups = dedup.group(files, perceptual)
+            job.duplicates = {
+                member: members[0] for members in groups for member in members[1:]
+            }
+            costs = [info.footprint if info is not None else 0 for info in index or ()]
+            if costs:
+                # Największe pliki najpierw - krótszy ogon zadania, gdy na
+                # końcu zostają już tylko małe pliki
+                groups.sort(key=lambda members: -costs[members[0]])
+            units = {}
+            engine = get_engine(initializer=initializer)
+            for item in engine.map(
+                task,
+                self._inputs(job, files, groups, costs, units),
+                *args,
+                lookup=lookup,
+                max_pending=2 * engine.max_workers,
+                cost=(lambda name, data: units.pop(id(data))) if costs else file_cost,
+            ):
+                # Indeks w puli to numer grupy - wracamy do indeksu pliku
+                members = groups[item.index]
+                item = item._replace(index=members[0])
+                if spill is not None and item.error is None:
+                    try:
+                        item = item._replace(value=spill(job.id, item))
+                    except Exception as e:
+                        item = item._replace(value=None, error=e)
+                # Duplikaty dostają ten sam wynik pod własną nazwą
+                job.items.extend(
+                    item._replace(index=index, name=job.names[index])
+                    for index in members
+                )
+                if job.cancelled:
+                    break
+            state = "cancelled" if job.cancelled else "done"
+        except Exception as e:
+            job.error = e
+            state = "failed"
+        # Najpierw czas zakończenia, potem stan - done oznacza komplet danych
+        job.finished = time.time()
+        job.state = state
+
+
+job_manager = JobManager(
+    runners=int(os.environ.get("RESIZER_JOB_RUNNERS", 1)),
+    keep_seconds=int(os.environ.get("RESIZER_JOB_TTL", 3600)),
+)
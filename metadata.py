@@ -0,0 +1,93 @@
+import io
+import os
+from typing import NamedTuple
+
+from PIL import Image
+
+# Znacznik orientacji EXIF; wartości 5-8 zamieniają szerokość z wysokością
+ORIENTATION = 0x0112
+
+
+class ImageInfo(NamedTuple):
+    width: int
+    height: int
+    format: str
+    mode: str
+    orientation: int
+    animated: bool
+    byte_size: int
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    @property
+    def aspect_ratio(self):
+        return self.width / self.height
+
+    @property
+    def footprint(self):
+        # Szacunek pamięci zdekodowanego obrazu (szerokość x wysokość x kanały)
+        return self.width * self.height * Image.getmodebands(self.mode)
+
+
+def _length(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return len(source)
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    position = source.tell()
+    length = source.seek(0, io.SEEK_END)
+    source.seek(position)
+    return length
+
+
+def read_info(source):
+    # Metadane z samego nagłówka - Image.open() nie dekoduje pikseli.
+    # source: bajty, ścieżka albo obiekt plikowy (pozycja jest przywracana);
+    # None dla pliku, którego Pillow nie rozpoznaje.
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        stream = io.BytesIO(source)
+    else:
+        stream = source
+    position = stream.tell() if hasattr(stream, "tell") else None
+    try:
+        with Image.open(stream) as image:
+            width, height = image.size
+            orientation = image.getexif().get(ORIENTATION, 1)
+            file_format, mode = image.format, image.mode
+            animated = getattr(image, "is_animated", False)
+    except Exception:
+        return None
+    finally:
+        if position is not None:
+            stream.seek(position)
+    return ImageInfo(
+        width, height, file_format, mode, orientation, animated, _length(source)
+    )
+
+
+class MetadataIndex:
+    # Metadane plików zapamiętane według tożsamości pliku (np. file_id
+    # z st.file_uploader), więc kolejne reruny nie czytają nagłówków
+    # ponownie. update() zostawia tylko wpisy bieżącego zestawu plików.
+    def __init__(self):
+        self._infos = {}
+        self.reads = 0
+
+    def get(self, key, source):
+        if key not in self._infos:
+            self._infos[key] = read_info(source)
+            self.reads += 1
+        return self._infos[key]
+
+    def update(self, entries):
+        # entries: pary (klucz, źródło); wynik: ImageInfo lub None w tej
+        # samej kolejności
+        entries = list(entries)
+        infos = [self.get(key, source) for key, source in entries]
+        keys = {key for key, _ in entries}
+        for key in list(self._infos):
+            if key not in keys:
+                del self._infos[key]
+        return infos
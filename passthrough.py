@@ -0,0 +1,84 @@
+import os
+import threading
+
+from metadata import read_info
+from resize_plan import SOURCE, plan_fit_width
+
+
+def _read(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    position = source.tell()
+    source.seek(0)
+    data = source.read()
+    source.seek(position)
+    return data
+
+
+def match(source, output_sizes, formats, info=None):
+    # Wyjścia (profil, format) trybów dopasowania do szerokości, które plik
+    # wejściowy już spełnia: ten sam format, plan_fit_width nie skaluje go
+    # wcale, a rozmiar mieści się w max_size_kb. Czyta tylko nagłówek i
+    # długość pliku. source: bajty, ścieżka albo obiekt plikowy; info:
+    # gotowe metadane.ImageInfo, jeśli nagłówek był już czytany.
+    info = info or read_info(source)
+    # Orientacja EXIF inna niż 1 - przeglądarka obraca oryginał, a
+    # przetworzone pliki zapisujemy bez metadanych
+    if info is None or info.orientation != 1 or info.animated:
+        return set()
+    if info.format not in formats:
+        return set()
+    plan = plan_fit_width(info.size, output_sizes)
+    return {
+        (name, info.format)
+        for name, (width, height, max_size_kb) in output_sizes.items()
+        if plan.outputs[name] == SOURCE and info.byte_size <= max_size_kb * 1024
+    }
+
+
+class Counter:
+    # Licznik trafień szybkiej ścieżki w bieżącym procesie
+    def __init__(self):
+        self.files = 0
+        self.outputs = 0
+        self.skipped_decodes = 0
+        self._lock = threading.Lock()
+
+    def add(self, outputs, skipped_decode):
+        if not outputs:
+            return
+        with self._lock:
+            self.files += 1
+            self.outputs += outputs
+            self.skipped_decodes += int(skipped_decode)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "files": self.files,
+                "outputs": self.outputs,
+                "skipped_decodes": self.skipped_decodes,
+            }
+
+
+counter = Counter()
+
+
+def passthrough(source, output_sizes, formats, total=None):
+    # {(profil, format): oryginalne bajty} dla wyjść bez pracy na pikselach;
+    # total to liczba wszystkich wyjść - gdy pasują wszystkie, dekodowanie
+    # jest zbędne i liczymy je jako pominięte
+    matched = match(source, output_sizes, formats)
+    if not matched:
+        return {}
+    data = _read(source)
+    counter.add(len(matched), len(matched) == total)
+    return dict.fromkeys(matched, data)
+
+
+def count(encodes):
+    # Wyjścia przepisane bez kodowania - mają 0 kodowań w raporcie wyniku
+    return sum(1 for value in encodes.values() if value == 0)
@@ -0,0 +1,363 @@
+import argparse
+import glob
+import importlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+import passthrough
+from admission import file_cost
+from batch import BatchEngine, default_workers
+from decode import decode_image
+from encoder import supported_formats
+from quality_search import PRESETS
+from face_detection import BACKENDS
+from frame import decode_frame
+from instrumentation import recording, write_jsonl
+from resampling import RESAMPLERS
+from resize_plan import BASE_WIDTH
+
+OUTPUT_SIZES = {
+    "Miniaturka": (600, 400, 50),  # (width, height, max_size_kb)
+    "Banner": (1200, 500, 100),
+    "Zdjęcie": (1200, 600, 100),
+}
+
+INPUT_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+# Znaki wieloznaczne wzorca glob
+GLOB_MAGIC = re.compile(r"[*?[]")
+
+# Tryb "cropped" odpowiada app.py (przycinanie + wykrywanie twarzy),
+# tryb "fit" odpowiada streamlit_app.py (dopasowanie do szerokości)
+MODES = ("cropped", "fit")
+
+
+def iter_inputs(source):
+    # Katalog lub wzorzec glob; pliki oddawane leniwie, bez listy w pamięci
+    if os.path.isdir(source):
+        with os.scandir(source) as entries:
+            for entry in entries:
+                extension = os.path.splitext(entry.name)[1].lower()
+                if entry.is_file() and extension in INPUT_EXTENSIONS:
+                    yield entry.path
+    else:
+        for path in glob.iglob(source, recursive=True):
+            if os.path.isfile(path):
+                yield path
+
+
+def input_root(source):
+    # Katalog, względem którego wyniki odtwarzają strukturę wejścia: sam
+    # katalog albo stała część wzorca glob przed pierwszym znakiem
+    # wieloznacznym
+    if os.path.isdir(source):
+        return source
+    root = os.path.dirname(source)
+    while GLOB_MAGIC.search(root):
+        root = os.path.dirname(root)
+    return root or "."
+
+
+def output_paths(path, output_dir, output_sizes, file_format="WEBP", root=None):
+    # Nazwa wyniku zawiera pełną nazwę źródła z rozszerzeniem, a katalog
+    # powtarza ścieżkę względem root - a.jpg i a.png oraz x/a.jpg i y/a.jpg
+    # nie nadpisują nawzajem swoich wyników
+    name = os.path.basename(path)
+    directory = output_dir
+    if root is not None:
+        relative = os.path.relpath(os.path.dirname(path) or ".", root)
+        directory = os.path.join(output_dir, relative)
+    extension = file_format.lower()
+    return {
+        size: os.path.normpath(os.path.join(directory, f"{name}_{size}.{extension}"))
+        for size in output_sizes
+    }
+
+
+def is_up_to_date(path, outputs):
+    try:
+        source_mtime = os.stat(path).st_mtime
+        return all(os.stat(out).st_mtime >= source_mtime for out in outputs.values())
+    except OSError:
+        return False
+
+
+def write_atomic(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def encode_file(
+    path,
+    mode,
+    output_sizes,
+    file_format="WEBP",
+    detect=True,
+    effort="max",
+    detector=None,
+    resampler=None,
+):
+    # decode -> [detect] -> resize -> encode dla jednego pliku z dysku;
+    # detector to nazwa backendu z face_detection.BACKENDS, resampler to
+    # metoda skalowania z resampling.RESAMPLERS (lub {profil: metoda})
+    encodes = {}
+    if mode == "cropped":
+        app = importlib.import_module("app")
+        frame, decode_report = decode_frame(path, BASE_WIDTH)
+        if detect and detector != "none":
+            app.highlight_faces(frame, app.detect_faces(frame, backend=detector))
+        results = app.process_image(
+            frame.image,
+            output_sizes,
+            encodes=encodes,
+            effort=effort,
+            resampler=resampler,
+            original_size=decode_report.original_size,
+        )
+    else:
+        streamlit_app = importlib.import_module("streamlit_app")
+        # Wyjścia, które plik już spełnia, są kopiowane; gdy to wszystkie,
+        # plik nie jest dekodowany
+        formats = streamlit_app.file_formats(file_format)
+        total = len(output_sizes) * len(formats)
+        ready = passthrough.passthrough(path, output_sizes, formats, total)
+        image, decode_report = None, None
+        if len(ready) < total:
+            image, decode_report = decode_image(
+                path, streamlit_app.max_width(output_sizes)
+            )
+        results = streamlit_app.process_image(
+            image,
+            output_sizes,
+            file_format,
+            encodes=encodes,
+            effort=effort,
+            resampler=resampler,
+            ready=ready,
+            original_size=decode_report.original_size if decode_report else None,
+        )
+    return results, encodes, decode_report
+
+
+def process_path(
+    name,
+    path,
+    mode,
+    output_sizes,
+    file_format,
+    detect,
+    output_dir,
+    metrics=False,
+    effort="max",
+    detector=None,
+    resampler=None,
+    root=None,
+):
+    # Zadanie dla procesu roboczego: wynik trafia od razu na dysk, a do
+    # procesu głównego wraca tylko krótkie podsumowanie
+    with recording(name, metrics) as recorder:
+        results, encodes, decode_report = encode_file(
+            path, mode, output_sizes, file_format, detect, effort, detector, resampler
+        )
+    outputs = output_paths(path, output_dir, output_sizes, file_format, root)
+    written = {}
+    for size, data in results.items():
+        os.makedirs(os.path.dirname(outputs[size]), exist_ok=True)
+        write_atomic(outputs[size], data)
+        written[size] = len(data)
+    records = recorder.records if recorder is not None else None
+    return written, encodes, decode_report, records
+
+
+def run(
+    source,
+    output_dir,
+    output_sizes=OUTPUT_SIZES,
+    mode="cropped",
+    file_format="WEBP",
+    detect=True,
+    workers=None,
+    resume=True,
+    on_skip=None,
+    metrics=False,
+    effort="max",
+    detector=None,
+    resampler=None,
+):
+    # Generator wyników (FileResult) w kolejności ukończenia. W locie jest
+    # najwyżej 2 * workers plików, więc pamięć nie zależy od liczby wejść.
+    if mode == "cropped":
+        file_format = "WEBP"
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or default_workers()
+    root = input_root(source)
+
+    def pending():
+        for path in iter_inputs(source):
+            outputs = output_paths(path, output_dir, output_sizes, file_format, root)
+            if resume and is_up_to_date(path, outputs):
+                if on_skip is not None:
+                    on_skip(path)
+                continue
+            yield path, path
+
+    detect = detect and detector != "none"
+    initializer = (
+        ("face_detection:warm_up", detector) if mode == "cropped" and detect else None
+    )
+    engine = BatchEngine(workers, initializer=initializer)
+    try:
+        yield from engine.map(
+            "pipeline:process_path",
+            pending(),
+            mode,
+            output_sizes,
+            file_format,
+            detect,
+            output_dir,
+            metrics,
+            effort,
+            detector,
+            resampler,
+            root,
+            max_pending=2 * workers,
+            cost=file_cost,
+        )
+    finally:
+        engine.shutdown()
+
+
+def load_profiles(path):
+    with open(path, encoding="utf-8") as f:
+        profiles = json.load(f)
+    return {size: tuple(values) for size, values in profiles.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Wsadowe przetwarzanie zdjęć bez interfejsu Streamlit."
+    )
+    parser.add_argument("source", help="katalog wejściowy lub wzorzec glob")
+    parser.add_argument("output_dir", help="katalog wyjściowy")
+    parser.add_argument("--mode", choices=MODES, default="cropped")
+    parser.add_argument(
+        "--profiles",
+        help='plik JSON {"nazwa": [width, height, max_size_kb], ...}',
+    )
+    parser.add_argument(
+        "--format",
+        choices=supported_formats(),
+        help="format wyników trybu fit (tryb cropped zapisuje zawsze WEBP)",
+    )
+    parser.add_argument("--no-detect", action="store_true")
+    parser.add_argument(
+        "--detector",
+        choices=list(BACKENDS),
+        help="backend detekcji twarzy (domyślnie RESIZER_DETECTOR lub retinaface)",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-resume", action="store_true")
+    parser.add_argument(
+        "--metrics", metavar="PATH", help="zapisz czasy etapów jako JSON lines"
+    )
+    parser.add_argument("--effort", choices=list(PRESETS), default="max")
+    parser.add_argument(
+        "--profile-effort",
+        action="append",
+        default=[],
+        metavar="NAZWA=PRESET",
+        help="preset kodera dla pojedynczego profilu",
+    )
+    parser.add_argument(
+        "--resampler",
+        choices=list(RESAMPLERS),
+        help="metoda skalowania (domyślnie RESIZER_RESAMPLER lub pillow-reduce)",
+    )
+    parser.add_argument(
+        "--profile-resampler",
+        action="append",
+        default=[],
+        metavar="NAZWA=METODA",
+        help="metoda skalowania dla pojedynczego profilu",
+    )
+    args = parser.parse_args(argv)
+    if args.mode == "cropped" and args.format not in (None, "WEBP"):
+        parser.error("tryb cropped zapisuje tylko WEBP - użyj --mode fit")
+
+    output_sizes = load_profiles(args.profiles) if args.profiles else OUTPUT_SIZES
+    effort = args.effort
+    if args.profile_effort:
+        overrides = dict(item.split("=", 1) for item in args.profile_effort)
+        for preset in overrides.values():
+            if preset not in PRESETS:
+                parser.error(f"nieznany preset: {preset}")
+        effort = {size: overrides.get(size, args.effort) for size in output_sizes}
+    resampler = args.resampler
+    if args.profile_resampler:
+        overrides = dict(item.split("=", 1) for item in args.profile_resampler)
+        for method in overrides.values():
+            if method not in RESAMPLERS:
+                parser.error(f"nieznana metoda skalowania: {method}")
+        resampler = {size: overrides.get(size, args.resampler) for size in output_sizes}
+    start_time = time.time()
+    processed_count = 0
+    failed_count = 0
+    skipped_count = 0
+    copied_count = 0
+
+    def count_skip(path):
+        nonlocal skipped_count
+        skipped_count += 1
+
+    for item in run(
+        args.source,
+        args.output_dir,
+        output_sizes,
+        mode=args.mode,
+        file_format=args.format or "WEBP",
+        detect=not args.no_detect,
+        workers=args.workers,
+        resume=not args.no_resume,
+        on_skip=count_skip,
+        metrics=bool(args.metrics),
+        effort=effort,
+        detector=args.detector,
+        resampler=resampler,
+    ):
+        if item.error is not None:
+            failed_count += 1
+            print(
+                f"Błąd podczas przetwarzania {item.name}: {item.error}", file=sys.stderr
+            )
+            continue
+        processed_count += 1
+        written, encodes, decode_report, records = item.value
+        copied_count += passthrough.count(encodes)
+        if records:
+            write_jsonl(records, args.metrics)
+        print(
+            f"Przetworzono: {item.name} "
+            f"({sum(written.values()) // 1024} KB, kodowań: {sum(encodes.values())})"
+        )
+
+    processing_time = time.time() - start_time
+    print(
+        f"Przetworzono {processed_count} plików, pominięto {skipped_count} aktualnych, "
+        f"błędy: {failed_count}, wyników bez przetwarzania: {copied_count}, "
+        f"czas {processing_time:.2f} sekund."
+    )
+    return 1 if failed_count else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
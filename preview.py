@@ -0,0 +1,19 @@
+import io
+import os
+
+from PIL import Image
+
+THUMBNAIL_SIZE = int(os.environ.get("RESIZER_THUMBNAIL_PX", 320))
+
+
+def make_thumbnail(path, size=THUMBNAIL_SIZE):
+    # Mały podgląd zakodowanego wyniku do listy plików - przeglądarka dostaje
+    # kilkanaście KB zamiast pełnego pliku wyjściowego
+    with Image.open(path) as image:
+        image.draft("RGB", (size, size))
+        image.thumbnail((size, size), reducing_gap=2.0)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        output = io.BytesIO()
+        image.save(output, format="WEBP", quality=70, method=0)
+        return output.getvalue()
@@ -0,0 +1,181 @@
+import io
+import threading
+from typing import NamedTuple
+
+import instrumentation
+
+# Formaty, w których parametr quality nie wpływa na wynik kodowania
+LOSSLESS_FORMATS = {"PNG"}
+
+
+class SearchResult(NamedTuple):
+    data: bytes
+    quality: int
+    encodes: int
+
+
+class EffortPreset(NamedTuple):
+    # Ustawienia koderów i budżet wyszukiwania jakości
+    webp_method: int
+    jpeg_optimize: bool
+    jpeg_progressive: bool
+    png_compress_level: int
+    avif_speed: int
+    max_encodes: int
+
+
+# "balanced" to domyślne ustawienia Pillow i dotychczasowy budżet kodowań;
+# przy mniej niż 6 kodowaniach "fast" potrafi skończyć na jakości 0 tam,
+# gdzie mieści się 10-45 (sprawdza to benchmark.py quality)
+PRESETS = {
+    "fast": EffortPreset(0, False, False, 1, 10, 6),
+    "balanced": EffortPreset(4, False, False, 6, 6, 7),
+    "max": EffortPreset(6, True, True, 9, 4, 10),
+}
+DEFAULT_EFFORT = "balanced"
+
+
+def effort_for(effort, size=None):
+    # effort: nazwa presetu albo {profil: nazwa} dla ustawień per profil
+    if isinstance(effort, dict):
+        effort = effort.get(size)
+    return effort or DEFAULT_EFFORT
+
+
+def effort_key(effort, output_sizes):
+    # Część klucza pamięci podręcznej - wynik zależy od presetu profilu
+    return tuple((size, effort_for(effort, size)) for size in output_sizes)
+
+
+def encoder_options(file_format, preset):
+    file_format = file_format.upper()
+    if file_format == "WEBP":
+        return {"method": preset.webp_method}
+    if file_format == "JPEG":
+        return {
+            "optimize": preset.jpeg_optimize,
+            "progressive": preset.jpeg_progressive,
+        }
+    if file_format == "PNG":
+        return {"compress_level": preset.png_compress_level}
+    if file_format == "AVIF":
+        return {"speed": preset.avif_speed}
+    return {}
+
+
+def encode(image, file_format, quality, preset=None):
+    options = encoder_options(file_format, preset) if preset is not None else {}
+    output_image = io.BytesIO()
+    image.save(output_image, format=file_format, quality=quality, **options)
+    return output_image.getvalue()
+
+
+class QualitySearch:
+    # Przeszukuje tę samą siatkę jakości co dawna pętla (100, 95, ..., 0),
+    # ale bisekcją, startując od jakości zapamiętanej dla danego profilu
+    # i presetu - wynik "fast" nie jest punktem startu dla "max".
+    def __init__(self, step=5, max_encodes=7, default_start=75):
+        self.step = step
+        self.max_encodes = max(max_encodes, 2)
+        self.default_start = default_start
+        self.grid = list(range(100 % step, 101, step))
+        self._hints = {}
+        self._lock = threading.Lock()
+
+    def hint(self, profile_key):
+        with self._lock:
+            return self._hints.get(profile_key, self.default_start)
+
+    def _learn(self, profile_key, quality):
+        with self._lock:
+            self._hints[profile_key] = quality
+
+    def reset(self):
+        with self._lock:
+            self._hints.clear()
+
+    def _index(self, quality):
+        return min(range(len(self.grid)), key=lambda i: abs(self.grid[i] - quality))
+
+    def search(
+        self,
+        image,
+        max_size_kb,
+        file_format="WEBP",
+        profile_key=None,
+        max_encodes=None,
+        effort=None,
+    ):
+        preset = PRESETS[effort] if effort is not None else None
+        if max_encodes is None and preset is not None:
+            max_encodes = preset.max_encodes
+        max_encodes = max(max_encodes or self.max_encodes, 2)
+        limit = max_size_kb * 1024
+        if isinstance(profile_key, tuple):
+            profile = str(profile_key[0])
+        else:
+            profile = profile_key
+
+        if file_format.upper() in LOSSLESS_FORMATS:
+            with instrumentation.span(
+                "encode", profile, quality=100, attempt=1
+            ) as stage:
+                data = encode(image, file_format, 100, preset)
+                stage.set(bytes=len(data))
+            return SearchResult(data, 100, 1)
+
+        # lo - najwyższy indeks, który się mieści; hi - najniższy, który nie
+        lo, hi = -1, len(self.grid)
+        best = None
+        floor = None
+        encodes = 0
+        hint_key = (profile_key, effort)
+        start = self._index(self.hint(hint_key))
+        probe = start
+
+        while hi - lo > 1 and encodes < max_encodes:
+            # Ostatnie dostępne kodowanie zostawiamy na najniższą jakość,
+            # żeby nigdy nie oddać wyniku większego niż dawna pętla
+            if lo < 0 and encodes == max_encodes - 1:
+                probe = 0
+
+            quality = self.grid[probe]
+            encodes += 1
+            with instrumentation.span(
+                "encode", profile, quality=quality, attempt=encodes
+            ) as stage:
+                data = encode(image, file_format, quality, preset)
+                stage.set(bytes=len(data))
+
+            if len(data) <= limit:
+                lo = probe
+                best = SearchResult(data, quality, 0)
+            else:
+                hi = probe
+                if probe == 0:
+                    floor = SearchResult(data, quality, 0)
+
+            if hi - lo <= 1:
+                break
+            if encodes == 1 and probe == start:
+                # Zwykle wynik jest tuż obok podpowiedzi - sprawdzamy sąsiada
+                probe = start + 1 if lo == start else start - 1
+            else:
+                probe = (lo + hi) // 2
+            probe = min(max(probe, lo + 1), hi - 1)
+
+        result = best or floor
+        if best is not None:
+            self._learn(hint_key, best.quality)
+        instrumentation.event(
+            "quality_search",
+            profile,
+            encodes=encodes,
+            retries=encodes - 1,
+            quality=result.quality,
+            bytes=len(result.data),
+        )
+        return result._replace(encodes=encodes)
+
+
+default_search = QualitySearch()
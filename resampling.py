@@ -0,0 +1,60 @@
+import importlib
+import os
+
+import numpy as np
+from PIL import Image
+
+# Tryby obrazów, które OpenCV skaluje bez konwersji; inne (np. RGBA z
+# przezroczystością, P) zawsze skaluje Pillow
+OPENCV_MODES = {"L", "RGB", "RGBX"}
+
+
+def pillow_lanczos(image, size):
+    return image.resize(size, Image.LANCZOS)
+
+
+def pillow_reduce(image, size):
+    # Najpierw reduce() o całkowity czynnik, potem LANCZOS na mniejszym
+    # obrazie - tak jak Image.thumbnail()
+    return image.resize(size, Image.LANCZOS, reducing_gap=2.0)
+
+
+def _opencv(interpolation):
+    def resize(image, size):
+        if image.mode not in OPENCV_MODES:
+            return pillow_lanczos(image, size)
+        cv2 = importlib.import_module("cv2")
+        pixels = cv2.resize(
+            np.asarray(image), size, interpolation=getattr(cv2, interpolation)
+        )
+        return Image.frombuffer(image.mode, size, pixels, "raw", image.mode, 0, 1)
+
+    return resize
+
+
+RESAMPLERS = {
+    "pillow-lanczos": pillow_lanczos,
+    "pillow-reduce": pillow_reduce,
+    "opencv-area": _opencv("INTER_AREA"),
+    "opencv-lanczos4": _opencv("INTER_LANCZOS4"),
+}
+
+# Najszybsza metoda mieszcząca się w progach PSNR/SSIM względem LANCZOS
+# według `benchmark.py resample`
+DEFAULT_RESAMPLER = os.environ.get("RESIZER_RESAMPLER", "pillow-reduce")
+
+
+def resampler_for(resampler, size=None):
+    # resampler: nazwa z RESAMPLERS albo {profil: nazwa} dla ustawień per profil
+    if isinstance(resampler, dict):
+        resampler = resampler.get(size)
+    return resampler or DEFAULT_RESAMPLER
+
+
+def resampler_key(resampler, output_sizes):
+    # Część klucza pamięci podręcznej - wynik zależy od metody skalowania
+    return tuple((size, resampler_for(resampler, size)) for size in output_sizes)
+
+
+def resize(image, size, resampler=None):
+    return RESAMPLERS[resampler_for(resampler)](image, size)
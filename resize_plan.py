@@ -0,0 +1,132 @@
+import instrumentation
+from resampling import RESAMPLERS, resampler_for
+
+SOURCE = ("source",)
+
+# Wspólna szerokość bazowa profili przycinanych w app.py
+BASE_WIDTH = 1200
+
+
+class ResizePlan:
+    # Graf kroków skalowania/przycinania wspólny dla wszystkich profili.
+    # Węzły o tym samym kluczu liczone są tylko raz, a kolejność wstawiania
+    # jest jednocześnie kolejnością topologiczną. Węzeł skalowania zawiera
+    # nazwę metody (resampling.RESAMPLERS), więc profile z różnymi metodami
+    # nie współdzielą wyników.
+    def __init__(self, source_size):
+        self.nodes = {SOURCE: source_size}
+        self.outputs = {}
+
+    def size(self, node):
+        return self.nodes[node]
+
+    def resize(self, parent, size, resampler=None):
+        if self.nodes[parent] == size:
+            return parent
+        node = ("resize", parent, (size, resampler_for(resampler)))
+        self.nodes.setdefault(node, size)
+        return node
+
+    def crop(self, parent, box):
+        if box == (0, 0) + self.nodes[parent]:
+            return parent
+        node = ("crop", parent, box)
+        self.nodes.setdefault(node, (box[2] - box[0], box[3] - box[1]))
+        return node
+
+    def output(self, name, node):
+        self.outputs[name] = node
+
+    def steps(self):
+        return [node for node in self.nodes if node != SOURCE]
+
+    def profiles_by_node(self):
+        # Profile korzystające z danego węzła - do opisu pomiarów
+        labels = {}
+        for name, node in self.outputs.items():
+            while node != SOURCE:
+                labels.setdefault(node, []).append(name)
+                node = node[1]
+        return {node: ",".join(names) for node, names in labels.items()}
+
+    def execute(self, image):
+        # Liczba odbiorców każdego węzła - bufor pośredni zwalniamy,
+        # gdy nikt już z niego nie korzysta
+        pending = {}
+        for node in self.steps():
+            pending[node[1]] = pending.get(node[1], 0) + 1
+        keep = set(self.outputs.values())
+
+        labels = self.profiles_by_node() if instrumentation.active() else {}
+
+        buffers = {SOURCE: image}
+        for node in self.steps():
+            op, parent, arg = node
+            source = buffers[parent]
+            width, height = self.nodes[node]
+            with instrumentation.span(
+                op, profile=labels.get(node), size=f"{width}x{height}"
+            ) as stage:
+                # resize() i crop() zwracają nowy obraz, więc copy() jest zbędne
+                if op == "resize":
+                    size, resampler = arg
+                    stage.set(resampler=resampler)
+                    buffers[node] = RESAMPLERS[resampler](source, size)
+                else:
+                    buffers[node] = source.crop(arg)
+
+            pending[parent] -= 1
+            if pending[parent] == 0 and parent not in keep and parent != SOURCE:
+                del buffers[parent]
+
+        return {name: buffers[node] for name, node in self.outputs.items()}
+
+
+def plan_cropped(
+    source_size,
+    output_sizes,
+    base_width=BASE_WIDTH,
+    resampler=None,
+    original_size=None,
+):
+    # Skalowanie do wspólnej szerokości, przycięcie do proporcji profilu
+    # i skalowanie do docelowego rozmiaru (tryby z app.py); resampler: nazwa
+    # metody skalowania albo {profil: nazwa}. original_size: wymiary pliku
+    # przed draft/reduce w dekoderze - proporcje liczymy z nich, inaczej
+    # wysokość potrafi różnić się o 1 px od przetwarzania pełnego obrazu
+    plan = ResizePlan(source_size)
+    src_width, src_height = original_size or source_size
+    base_size = (base_width, int(base_width * src_height / src_width))
+
+    for size, (width, height, max_size_kb) in output_sizes.items():
+        method = resampler_for(resampler, size)
+        base = plan.resize(SOURCE, base_size, method)
+        img_width, img_height = plan.size(base)
+        aspect_ratio = width / height
+
+        if img_width / img_height > aspect_ratio:
+            new_width = int(img_height * aspect_ratio)
+            offset = (img_width - new_width) // 2
+            cropped = plan.crop(base, (offset, 0, offset + new_width, img_height))
+        else:
+            new_height = int(img_width / aspect_ratio)
+            offset = (img_height - new_height) // 2
+            cropped = plan.crop(base, (0, offset, img_width, offset + new_height))
+
+        plan.output(size, plan.resize(cropped, (width, height), method))
+    return plan
+
+
+def plan_fit_width(source_size, output_sizes, resampler=None, original_size=None):
+    # Skalowanie do szerokości profilu z zachowaniem proporcji
+    # (tryby ze streamlit_app.py - wysokość profilu jest pomijana);
+    # original_size jak w plan_cropped
+    plan = ResizePlan(source_size)
+    width, height = original_size or source_size
+    aspect_ratio = width / height
+
+    for size, (width, height, max_size_kb) in output_sizes.items():
+        new_height = int(width / aspect_ratio)
+        method = resampler_for(resampler, size)
+        plan.output(size, plan.resize(SOURCE, (width, new_height), method))
+    return plan
@@ -0,0 +1,207 @@
+import hashlib
+import os
+import pickle
+import stat
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def content_hash(data):
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def profile_key(output_sizes, file_format="WEBP"):
+    # Krotka (nazwa, szerokość, wysokość, max_size_kb, format) dla każdego profilu
+    return tuple(
+        (size, width, height, max_size_kb, file_format)
+        for size, (width, height, max_size_kb) in output_sizes.items()
+    )
+
+
+def private_directory(path):
+    # Wpisy z dysku są czytane przez pickle.loads, więc katalog musi należeć
+    # do bieżącego użytkownika i nie może być zapisywalny dla innych - kto
+    # podłoży własny katalog (np. we współdzielonym /tmp), wykonałby kod
+    # w aplikacji. Zwraca ścieżkę albo None (warstwa dyskowa wyłączona).
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        info = os.lstat(path)
+    except OSError:
+        return None
+    problem = None
+    if not stat.S_ISDIR(info.st_mode):
+        problem = "to nie jest katalog (lub jest dowiązaniem)"
+    elif hasattr(os, "getuid") and info.st_uid != os.getuid():
+        problem = "należy do innego użytkownika"
+    elif info.st_mode & 0o022:
+        problem = "jest zapisywalny dla innych użytkowników"
+    if problem is not None:
+        print(f"Pamięć podręczna na dysku wyłączona: {path} {problem}", file=sys.stderr)
+        return None
+    if info.st_mode & 0o077:
+        os.chmod(path, 0o700)
+    return path
+
+
+class ResultCache:
+    # Dwupoziomowa pamięć podręczna wyników adresowana treścią: LRU w pamięci
+    # procesu i katalog na dysku z usuwaniem najstarszych plików po
+    # przekroczeniu limitu rozmiaru. Katalog jest współdzielony przez procesy
+    # robocze i kolejne sesje.
+    def __init__(self, directory=None, memory_bytes=256 << 20, disk_bytes=1 << 30):
+        self.directory = private_directory(directory) if directory else None
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._disk_used = None
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+    def _digest(self, key):
+        return hashlib.blake2b(repr(key).encode(), digest_size=20).hexdigest()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest + ".pkl")
+
+    def _remember(self, digest, blob):
+        with self._lock:
+            if digest in self._memory:
+                self._memory_used -= len(self._memory.pop(digest))
+            self._memory[digest] = blob
+            self._memory_used += len(blob)
+            while self._memory_used > self.memory_bytes and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= len(evicted)
+
+    def get(self, key):
+        digest = self._digest(key)
+        with self._lock:
+            blob = self._memory.get(digest)
+            if blob is not None:
+                self._memory.move_to_end(digest)
+                self.hits_memory += 1
+                return pickle.loads(blob)
+
+        if self.directory:
+            path = self._path(digest)
+            try:
+                with open(path, "rb") as f:
+                    blob = f.read()
+                os.utime(path)
+            except OSError:
+                blob = None
+            if blob is not None:
+                self._remember(digest, blob)
+                with self._lock:
+                    self.hits_disk += 1
+                return pickle.loads(blob)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        digest = self._digest(key)
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self._remember(digest, blob)
+        if not self.directory:
+            return
+
+        path = self._path(digest)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        with self._lock:
+            if self._disk_used is not None:
+                self._disk_used += len(blob)
+        self._evict_disk()
+
+    def _scan(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".pkl"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict_disk(self):
+        with self._lock:
+            if self._disk_used is not None and self._disk_used <= self.disk_bytes:
+                return
+        entries = self._scan()
+        used = sum(size for _, size, _ in entries)
+        if used > self.disk_bytes:
+            # Usuwamy najdawniej używane wpisy do 90% limitu
+            for _, size, path in sorted(entries):
+                if used <= self.disk_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                used -= size
+        with self._lock:
+            self._disk_used = used
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+        if self.directory:
+            for _, _, path in self._scan():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            with self._lock:
+                self._disk_used = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "memory_bytes": self._memory_used,
+                "memory_items": len(self._memory),
+            }
+
+    def summary(self):
+        stats = self.stats()
+        hits = stats["hits_memory"] + stats["hits_disk"]
+        return (
+            f"Pamięć podręczna: {hits} trafień "
+            f"({stats['hits_disk']} z dysku), {stats['misses']} chybień"
+        )
+
+
+result_cache = ResultCache(
+    directory=os.environ.get(
+        "RESIZER_CACHE_DIR",
+        os.path.join(
+            tempfile.gettempdir(),
+            (
+                f"resizer-cache-{os.getuid()}"
+                if hasattr(os, "getuid")
+                else "resizer-cache"
+            ),
+        ),
+    ),
+    disk_bytes=int(os.environ.get("RESIZER_CACHE_MB", 1024)) << 20,
+)
@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import NamedTuple
+
+
+class Handle(NamedTuple):
+    # Lekki uchwyt do wyniku zapisanego na dysku - tylko ścieżka i rozmiar
+    path: str
+    size: int
+
+    def read(self):
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+class ResultStore:
+    # Wyniki przetwarzania zapisywane do osobnego katalogu dla każdego
+    # zadania (przestrzeni nazw), zamiast trzymać bajty w pamięci procesu.
+    # Katalogi nieużywane dłużej niż ttl sekund są usuwane, a po
+    # przekroczeniu max_bytes usuwane są najdawniej używane.
+    def __init__(self, directory, ttl=3600, max_bytes=2 << 30, check_interval=60):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.check_interval = check_interval
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def _namespace_dir(self, namespace):
+        return os.path.join(self.directory, namespace)
+
+    def put(self, namespace, key, data):
+        directory = self._namespace_dir(namespace)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, key)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return Handle(path, len(data))
+
+    def put_results(self, namespace, index, results):
+        # {profil: bajty} -> {profil: Handle}; nazwy plików od numeru
+        # pliku w zadaniu, bo nazwy przesłanych plików mogą się powtarzać
+        handles = {
+            size: self.put(namespace, f"{index:05d}-{position}", data)
+            for position, (size, data) in enumerate(results.items())
+        }
+        self.touch(namespace)
+        self.cleanup()
+        return handles
+
+    def touch(self, namespace):
+        try:
+            os.utime(self._namespace_dir(namespace))
+        except OSError:
+            pass
+
+    def remove(self, namespace):
+        shutil.rmtree(self._namespace_dir(namespace), ignore_errors=True)
+
+    def _scan(self):
+        entries = []
+        try:
+            namespaces = os.scandir(self.directory)
+        except OSError:
+            return entries
+        with namespaces:
+            for entry in namespaces:
+                if not entry.is_dir():
+                    continue
+                size = 0
+                for root, _, files in os.walk(entry.path):
+                    for name in files:
+                        try:
+                            size += os.stat(os.path.join(root, name)).st_size
+                        except OSError:
+                            continue
+                entries.append((entry.stat().st_mtime, size, entry.name))
+        return entries
+
+    def cleanup(self, force=False):
+        with self._lock:
+            now = time.time()
+            if not force and now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+
+        entries = sorted(self._scan())
+        used = sum(size for _, size, _ in entries)
+        for mtime, size, namespace in entries:
+            if now - mtime <= self.ttl and used <= self.max_bytes:
+                break
+            self.remove(namespace)
+            used -= size
+
+    def stats(self):
+        entries = self._scan()
+        return {
+            "namespaces": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+        }
+
+
+result_store = ResultStore(
+    directory=os.environ.get(
+        "RESIZER_STORE_DIR", os.path.join(tempfile.gettempdir(), "resizer-results")
+    ),
+    ttl=int(os.environ.get("RESIZER_STORE_TTL", 3600)),
+    max_bytes=int(os.environ.get("RESIZER_STORE_MB", 2048)) << 20,
+)
@@ -0,0 +1,558 @@
+import argparse
+import base64
+import http.client
+import io
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import zipfile
+from collections import Counter
+from contextlib import contextmanager
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import admission
+import passthrough
+from archive import compress_type
+from batch import BatchEngine, default_workers
+from encoder import supported_formats
+from face_detection import BACKENDS, DEFAULT_BACKEND
+from pipeline import MODES, OUTPUT_SIZES, encode_file, load_profiles
+from quality_search import PRESETS
+from resampling import DEFAULT_RESAMPLER, RESAMPLERS
+
+MIME_TYPES = {
+    "WEBP": "image/webp",
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "AVIF": "image/avif",
+}
+
+
+def process_upload(
+    name, data, mode, output_sizes, file_format, detect, effort, detector, resampler
+):
+    # Zadanie dla procesu roboczego: bajty z żądania -> zakodowane profile
+    results, encodes, decode_report = encode_file(
+        io.BytesIO(data),
+        mode,
+        output_sizes,
+        file_format,
+        detect,
+        effort,
+        detector,
+        resampler,
+    )
+    return results, encodes
+
+
+class Busy(Exception):
+    pass
+
+
+class RequestGate:
+    # Ogranicza liczbę jednocześnie przetwarzanych żądań; pozostałe czekają
+    # w kolejce, a po przekroczeniu max_queue są odrzucane (503)
+    def __init__(self, limit, max_queue):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self.requests = 0
+        self.rejected = 0
+        self.files = 0
+        self.failed = 0
+        self.passthrough = 0
+        self.seconds = 0.0
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self):
+        with self._lock:
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise Busy()
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+        self._slots.acquire()
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.requests += 1
+                self.seconds += time.perf_counter() - start
+            self._slots.release()
+
+    def count(self, item):
+        with self._lock:
+            self.files += 1
+            if item.error is not None:
+                self.failed += 1
+            else:
+                self.passthrough += passthrough.count(item.value[1])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self.active,
+                "queue_depth": self.queued,
+                "peak_queue_depth": self.peak_queued,
+                "limit": self.limit,
+                "max_queue": self.max_queue,
+                "requests": self.requests,
+                "rejected": self.rejected,
+                "files": self.files,
+                "failed": self.failed,
+                "passthrough": self.passthrough,
+                "seconds": round(self.seconds, 3),
+            }
+
+
+class ChunkedWriter:
+    # Strumień zapisu w kodowaniu chunked (HTTP/1.1) - ZIP i NDJSON płyną do
+    # klienta w miarę kończenia kolejnych plików
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, data):
+        if data:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        return len(data)
+
+    def flush(self):
+        self.wfile.flush()
+
+    def close(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def parse_multipart(content_type, body):
+    # Pary (nazwa, bajty) z części formularza, które mają nazwę pliku
+    message = BytesParser(policy=policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+    )
+    if not message.is_multipart():
+        raise ValueError("oczekiwano multipart/form-data")
+    return [
+        (part.get_filename(), part.get_payload(decode=True))
+        for part in message.iter_parts()
+        if part.get_filename()
+    ]
+
+
+class Options:
+    # Parametry żądania z adresu:
+    # ?mode=&format=&effort=&detect=&detector=&resampler=&profile=&output=
+    def __init__(self, query, service):
+        params = parse_qs(query)
+
+        def single(name, default):
+            return params.get(name, [default])[-1]
+
+        self.mode = single("mode", "cropped")
+        if self.mode not in MODES:
+            raise ValueError(f"nieznany tryb: {self.mode}")
+        self.file_format = single("format", "WEBP").upper()
+        if self.mode == "cropped":
+            self.file_format = "WEBP"
+        if self.file_format not in supported_formats():
+            raise ValueError(f"nieobsługiwany format: {self.file_format}")
+        self.effort = single("effort", service.effort)
+        if self.effort not in PRESETS:
+            raise ValueError(f"nieznany preset: {self.effort}")
+        self.detect = service.detect and single("detect", "1") not in ("0", "false")
+        self.detector = single("detector", service.detector)
+        if self.detector not in BACKENDS:
+            raise ValueError(f"nieznany detektor: {self.detector}")
+        self.resampler = single("resampler", service.resampler)
+        if self.resampler not in RESAMPLERS:
+            raise ValueError(f"nieznana metoda skalowania: {self.resampler}")
+        self.output = single("output", "zip")
+        if self.output not in ("zip", "ndjson"):
+            raise ValueError(f"nieznany format odpowiedzi: {self.output}")
+        profiles = params.get("profile")
+        unknown = set(profiles or ()) - set(service.output_sizes)
+        if unknown:
+            raise ValueError(f"nieznane profile: {', '.join(sorted(unknown))}")
+        self.output_sizes = {
+            size: values
+            for size, values in service.output_sizes.items()
+            if not profiles or size in profiles
+        }
+
+    def args(self):
+        return (
+            self.mode,
+            self.output_sizes,
+            self.file_format,
+            self.detect,
+            self.effort,
+            self.detector,
+            self.resampler,
+        )
+
+
+class ResizeService:
+    # Stan współdzielony przez wątki serwera: rozgrzana pula procesów z
+    # załadowanym detektorem, bramka współbieżności i liczniki
+    def __init__(
+        self,
+        workers=None,
+        output_sizes=OUTPUT_SIZES,
+        detect=True,
+        detector=None,
+        effort="max",
+        resampler=None,
+        limit=None,
+        max_queue=64,
+        max_body=512 << 20,
+    ):
+        self.workers = workers or default_workers()
+        self.output_sizes = output_sizes
+        self.detect = detect and detector != "none"
+        self.detector = detector or DEFAULT_BACKEND
+        self.effort = effort
+        self.resampler = resampler or DEFAULT_RESAMPLER
+        self.max_body = max_body
+        self.gate = RequestGate(limit or self.workers, max_queue)
+        # Pula ładuje z góry detektor domyślny; inne wybrane w żądaniu
+        # ładują się w procesie roboczym przy pierwszym użyciu
+        initializer = ("face_detection:warm_up", self.detector) if self.detect else None
+        self.engine = BatchEngine(self.workers, initializer=initializer)
+
+    def process(self, files, options):
+        # files jako generator - BatchEngine nie przechodzi wtedy w tryb
+        # inline dla pojedynczego pliku i praca zostaje w puli procesów
+        for item in self.engine.map(
+            "server:process_upload",
+            (pair for pair in files),
+            *options.args(),
+            max_pending=2 * self.workers,
+            cost=admission.file_cost,
+        ):
+            self.gate.count(item)
+            yield item
+
+    def metrics(self):
+        return {
+            **self.gate.stats(),
+            "workers": self.workers,
+            "admission": admission.stats(),
+        }
+
+
+class Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 - połączenia keep-alive; każda odpowiedź ma Content-Length
+    # albo kodowanie chunked
+    protocol_version = "HTTP/1.1"
+    server_version = "resizer"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_body(self, status, body, content_type, headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, value, headers=()):
+        body = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        self.send_body(status, body, "application/json", headers)
+
+    def body_length(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.service.max_body:
+            raise OverflowError(f"żądanie większe niż {self.service.max_body} B")
+        return length
+
+    def reject(self, status, value, headers=()):
+        # Odpowiedź bez czytania ciała - połączenia nie da się dalej używać;
+        # nagłówek Connection: close ustawia też close_connection
+        self.send_json(status, value, [*headers, ("Connection", "close")])
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/metrics":
+            self.send_json(200, self.service.metrics())
+        elif path == "/health":
+            self.send_json(200, {"status": "ok"})
+        else:
+            self.send_json(404, {"error": "nie znaleziono"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path not in ("/resize", "/batch"):
+            self.reject(404, {"error": "nie znaleziono"})
+            return
+        try:
+            options = Options(url.query, self.service)
+            length = self.body_length()
+        except OverflowError as e:
+            self.reject(413, {"error": str(e)})
+            return
+        except ValueError as e:
+            self.reject(400, {"error": str(e)})
+            return
+
+        try:
+            with self.service.gate.slot():
+                # Ciało czytamy dopiero po zajęciu miejsca w bramce - żądania
+                # czekające w kolejce nie trzymają przesłanych bajtów w pamięci
+                body = self.rfile.read(length)
+                if url.path == "/resize":
+                    name = self.headers.get("X-File-Name", "image")
+                    files = [(name, body)]
+                else:
+                    try:
+                        files = parse_multipart(
+                            self.headers.get("Content-Type", ""), body
+                        )
+                    except ValueError as e:
+                        self.send_json(400, {"error": str(e)})
+                        return
+                del body
+                if url.path == "/resize" and len(options.output_sizes) == 1:
+                    self.send_single(files, options)
+                else:
+                    self.send_stream(files, options)
+        except Busy:
+            self.reject(503, {"error": "kolejka pełna"}, headers=[("Retry-After", "1")])
+        except ConnectionError:
+            # Klient rozłączył się w trakcie - niedokończone pliki anuluje
+            # zamknięcie generatora BatchEngine.map
+            self.close_connection = True
+
+    def send_single(self, files, options):
+        # Jeden plik i jeden profil - odpowiedzią jest sam obraz
+        item = next(self.service.process(files, options))
+        if item.error is not None:
+            self.send_json(422, {"name": item.name, "error": str(item.error)})
+            return
+        results, encodes = item.value
+        self.send_body(
+            200,
+            next(iter(results.values())),
+            MIME_TYPES[options.file_format],
+            headers=[("X-Encodes", str(sum(encodes.values())))],
+        )
+
+    def send_stream(self, files, options):
+        self.send_response(200)
+        if options.output == "zip":
+            self.send_header("Content-Type", "application/zip")
+        else:
+            self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        writer = ChunkedWriter(self.wfile)
+        items = self.service.process(files, options)
+        if options.output == "zip":
+            self.stream_zip(writer, items, options, [name for name, _ in files])
+        else:
+            self.stream_ndjson(writer, items)
+        writer.close()
+
+    def stream_zip(self, writer, items, options, names):
+        # Wpisy dopisywane do archiwum w kolejności ukończenia; błędy
+        # trafiają na koniec do errors.json. Nazwa bez rozszerzenia
+        # powtórzona w żądaniu (a.jpg i a.png) dostaje numer pliku.
+        errors = {}
+        counts = Counter(os.path.splitext(name)[0] for name in names)
+        stems = set()
+        extension = options.file_format.lower()
+        with zipfile.ZipFile(writer, "w") as zf:
+            for item in items:
+                if item.error is not None:
+                    errors[item.name] = str(item.error)
+                    continue
+                stem = os.path.splitext(item.name)[0]
+                if counts[stem] > 1:
+                    stem = f"{stem}-{item.index}"
+                while stem in stems:
+                    stem = f"{stem}-{item.index}"
+                stems.add(stem)
+                for size, data in item.value[0].items():
+                    name = f"{stem}_{size}.{extension}"
+                    zf.writestr(name, data, compress_type=compress_type(name))
+                writer.flush()
+            if errors:
+                zf.writestr("errors.json", json.dumps(errors, ensure_ascii=False))
+
+    def stream_ndjson(self, writer, items):
+        # Jedna linia JSON na plik; dane obrazów w base64
+        for item in items:
+            line = {"index": item.index, "name": item.name}
+            if item.error is not None:
+                line["error"] = str(item.error)
+            else:
+                results, encodes = item.value
+                line["encodes"] = sum(encodes.values())
+                line["outputs"] = {
+                    size: base64.b64encode(data).decode("ascii")
+                    for size, data in results.items()
+                }
+            writer.write(json.dumps(line, ensure_ascii=False).encode("utf-8") + b"\n")
+            writer.flush()
+
+
+class ResizeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, verbose=False):
+        super().__init__(address, Handler)
+        self.service = service
+        self.verbose = verbose
+
+
+def load_test(url, data, concurrency=4, requests=40, query=""):
+    # Każdy wątek używa jednego połączenia keep-alive i wysyła żądania
+    # /resize jedno po drugim; wynik: przepustowość i percentyle opóźnień
+    target = urlsplit(url)
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        connection = http.client.HTTPConnection(target.hostname, target.port)
+        try:
+            while True:
+                with lock:
+                    if next(counter, None) is None:
+                        return
+                start = time.perf_counter()
+                connection.request(
+                    "POST",
+                    f"/resize?{query}",
+                    body=data,
+                    headers={"Content-Type": "application/octet-stream"},
+                )
+                response = connection.getresponse()
+                response.read()
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+                    if response.status != 200:
+                        errors.append(response.status)
+        finally:
+            connection.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    connection = http.client.HTTPConnection(target.hostname, target.port)
+    connection.request("GET", "/metrics")
+    metrics = json.loads(connection.getresponse().read())
+    connection.close()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "seconds": seconds,
+        "requests_per_second": len(latencies) / seconds,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+        "server": metrics,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Lokalna usługa HTTP skalowania.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="uruchom serwer")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8581)
+    serve_parser.add_argument(
+        "--profiles",
+        help='plik JSON {"nazwa": [width, height, max_size_kb], ...}',
+    )
+    serve_parser.add_argument("--workers", type=int, default=None)
+    serve_parser.add_argument(
+        "--limit", type=int, default=None, help="żądania przetwarzane jednocześnie"
+    )
+    serve_parser.add_argument("--max-queue", type=int, default=64)
+    serve_parser.add_argument("--max-body-mb", type=int, default=512)
+    serve_parser.add_argument("--effort", choices=list(PRESETS), default="max")
+    serve_parser.add_argument("--no-detect", action="store_true")
+    serve_parser.add_argument("--detector", choices=list(BACKENDS))
+    serve_parser.add_argument("--resampler", choices=list(RESAMPLERS))
+    serve_parser.add_argument("--verbose", action="store_true")
+
+    load_parser = commands.add_parser("loadtest", help="test obciążeniowy")
+    load_parser.add_argument("url", nargs="?", default="http://127.0.0.1:8581")
+    load_parser.add_argument(
+        "--image", help="plik wejściowy (domyślnie syntetyczne zdjęcie 1920x1080)"
+    )
+    load_parser.add_argument("--concurrency", type=int, default=4)
+    load_parser.add_argument("--requests", type=int, default=40)
+    load_parser.add_argument(
+        "--query", default="", help="parametry żądania, np. mode=fit&profile=Banner"
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.command == "loadtest":
+        if args.image:
+            with open(args.image, "rb") as f:
+                data = f.read()
+        else:
+            from benchmark import synthetic_inputs
+
+            data = dict(synthetic_inputs([(1920, 1080)]))["photo-1920x1080"]
+        report = load_test(args.url, data, args.concurrency, args.requests, args.query)
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return 1 if report["errors"] else 0
+
+    service = ResizeService(
+        workers=args.workers,
+        output_sizes=load_profiles(args.profiles) if args.profiles else OUTPUT_SIZES,
+        detect=not args.no_detect,
+        detector=args.detector,
+        effort=args.effort,
+        resampler=args.resampler,
+        limit=args.limit,
+        max_queue=args.max_queue,
+        max_body=args.max_body_mb << 20,
+    )
+    service.engine.warm_up()
+    server = ResizeServer((args.host, args.port), service, verbose=args.verbose)
+    print(f"Nasłuchuję na http://{args.host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.engine.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
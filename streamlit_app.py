@@ -2,32 +2,188 @@ import streamlit as st
 from PIL import Image
 import os
 import io
-import time
-import zipfile
-
-def process_image(image, output_sizes, file_format="WEBP"):
+from encoder import EncodeTask, encode_all, supported_formats
+from quality_search import PRESETS, effort_for, effort_key
+from resampling import DEFAULT_RESAMPLER, RESAMPLERS, resampler_key
+from resize_plan import plan_fit_width
+from decode import decode_image
+from archive import ZipSpool
+from result_cache import content_hash, profile_key, result_cache
+from job_view import attached_job, current_job, dedup_summary, mode_index, mode_select, show_job, submit_job, upload_index
+import admission
+from admission import decode_budget, footprint
+import passthrough
+from instrumentation import LOG_PATH, recording, summarize, write_jsonl
+
+def file_formats(file_format):
+    return (file_format,) if isinstance(file_format, str) else tuple(file_format)
+
+def output_key(size, file_format, primary_format):
+    # Format podstawowy pod nazwą profilu, dodatkowe jako "profil-format"
+    if file_format == primary_format:
+        return size
+    return f"{size}-{file_format.lower()}"
+
+def process_image(image, output_sizes, file_format="WEBP", encodes=None, cache_key=None, effort=None, resampler=None, ready=None, original_size=None):
+    # file_format: jeden format albo krotka (podstawowy, zapasowe...) -
+    # wszystkie kodowane w jednym przebiegu po przeskalowanych obrazach.
+    # cache_key identyfikuje treść obrazu wejściowego (np. skrót pliku);
+    # effort: preset kodera ("fast"/"balanced"/"max") lub {profil: preset};
+    # resampler: metoda skalowania z resampling.RESAMPLERS lub {profil: metoda};
+    # ready: {(profil, format): bajty} wyjść, które plik wejściowy już spełnia
+    # (passthrough.passthrough) - te nie są kodowane ponownie, a gdy są to
+    # wszystkie wyjścia, image może być None; original_size: wymiary pliku
+    # przed dekodowaniem z draft/reduce - z nich liczone są wysokości
+    ready = ready or {}
+    formats = file_formats(file_format)
+    if cache_key is not None:
+        key = ("fit_width", cache_key, profile_key(output_sizes, "+".join(formats)), effort_key(effort, output_sizes), resampler_key(resampler, output_sizes))
+        results = result_cache.get(key)
+        if results is not None:
+            return results
+    
     results = {}
-    for size, (width, height, max_size_kb) in output_sizes.items():
-        img_copy = image.copy()
-        
-        # Obliczanie nowej wysokości przy zachowaniu proporcji
-        aspect_ratio = img_copy.width / img_copy.height
-        new_height = int(width / aspect_ratio)
-        
-        img_copy = img_copy.resize((width, new_height), Image.LANCZOS)
-        
-        output_image = io.BytesIO()
-        quality = 100
-        img_copy.save(output_image, format=file_format, quality=quality)
-        
-        while output_image.tell() > max_size_kb * 1024 and quality > 0:
-            quality -= 5
-            output_image = io.BytesIO()
-            img_copy.save(output_image, format=file_format, quality=quality)
-        
-        results[size] = output_image.getvalue()
+    # Profile o tej samej szerokości korzystają z jednego przeskalowanego obrazu
+    resized = plan_fit_width(image.size, output_sizes, resampler, original_size).execute(image) if image is not None else {}
+    tasks = {
+        output_key(size, fmt, formats[0]): EncodeTask(
+            resized[size], max_size_kb, fmt, (size, width, max_size_kb, fmt), effort_for(effort, size)
+        )
+        for size, (width, height, max_size_kb) in output_sizes.items()
+        for fmt in formats
+        if (size, fmt) not in ready
+    }
+    encoded = encode_all(tasks)
+    for size in output_sizes:
+        for fmt in formats:
+            output = output_key(size, fmt, formats[0])
+            result = encoded.get(output)
+            if encodes is not None:
+                encodes[output] = result.encodes if result is not None else 0
+            
+            results[output] = result.data if result is not None else ready[(size, fmt)]
+    
+    if cache_key is not None:
+        result_cache.put(key, results)
     return results
 
+def max_width(output_sizes):
+    return max(width for width, height, max_size_kb in output_sizes.values())
+
+def planned_sizes(index, output_sizes):
+    # Wymiary wyników wyliczone z nagłówków (metadata.ImageInfo) przed
+    # przetwarzaniem - pliki o tych samych wymiarach zliczane razem
+    planned = {}
+    for info in index:
+        if info is None:
+            continue
+        plan = plan_fit_width(info.size, output_sizes)
+        for size in output_sizes:
+            width, height = plan.size(plan.outputs[size])
+            planned[f"{width}x{height}"] = planned.get(f"{width}x{height}", 0) + 1
+    unreadable = sum(1 for info in index if info is None)
+    text = "Planowane wymiary: " + ", ".join(f"{dims} ({count})" for dims, count in planned.items())
+    return text + (f"; nierozpoznane pliki: {unreadable}" if unreadable else "")
+
+def cached_upload(name, data, output_sizes, file_format="WEBP", effort=None, resampler=None):
+    # Wynik z pamięci podręcznej - bez dekodowania i bez wysyłania do puli
+    key = ("fit_width", content_hash(data), profile_key(output_sizes, "+".join(file_formats(file_format))), effort_key(effort, output_sizes), resampler_key(resampler, output_sizes))
+    results = result_cache.get(key)
+    if results is not None:
+        return results, {}, None, None
+
+def process_upload(name, data, output_sizes, file_format="WEBP", metrics=False, effort=None, resampler=None):
+    # Zadanie dla procesu roboczego: bajty pliku -> zakodowane profile
+    cached = cached_upload(name, data, output_sizes, file_format, effort, resampler)
+    if cached is not None:
+        return cached
+    
+    # Plik, który już spełnia wszystkie profile, nie jest nawet dekodowany
+    formats = file_formats(file_format)
+    ready = passthrough.passthrough(data, output_sizes, formats, len(output_sizes) * len(formats))
+    if len(ready) == len(output_sizes) * len(formats):
+        encodes = {}
+        return process_image(None, output_sizes, file_format, encodes=encodes, ready=ready), encodes, None, None
+    
+    with recording(name, metrics) as recorder:
+        image, decode_report = decode_image(io.BytesIO(data), max_width(output_sizes))
+        encodes = {}
+        results = process_image(image, output_sizes, file_format, encodes=encodes, cache_key=content_hash(data), effort=effort, resampler=resampler, ready=ready, original_size=decode_report.original_size)
+    records = recorder.records if recorder is not None else None
+    return results, encodes, decode_report, records
+
+def show_metrics(records, log=True):
+    # Tabela czasów etapów w interfejsie + zapis JSON lines do logów
+    if records:
+        if log:
+            write_jsonl(records)
+        st.dataframe(summarize(records))
+
+def show_result(item):
+    # Miniatura i przyciski pobierania dla każdego profilu
+    results, encodes, decode_report, records, preview = item.value
+    st.write(f"Przetworzono: {item.name}")
+    if decode_report and decode_report.saved_bytes:
+        st.caption(decode_report.summary())
+    
+    # Wyniki zadań to uchwyty do plików - bajty czytane dopiero po kliknięciu
+    cols = st.columns(3)
+    with cols[0]:
+        st.image(preview.path, caption="Podgląd", use_column_width=True)
+    
+    for idx, (size, handle) in enumerate(results.items()):
+        with cols[(idx + 1) % 3]:
+            st.download_button(
+                label=f"Pobierz {size}",
+                data=handle.read,
+                file_name=f"{os.path.splitext(item.name)[0]}_{size}.webp",
+                mime="image/webp",
+            )
+    st.write("---")
+
+def output_info(handle):
+    # Wymiary i rozszerzenie z nagłówka zakodowanego pliku (bez dekodowania)
+    with Image.open(handle.path) as processed_image:
+        return processed_image.size, processed_image.format.lower()
+
+def show_single_result(item):
+    # Jeden profil o szerokości z formularza (w formacie podstawowym i
+    # zapasowych); wymiary i format odczytujemy z zakodowanego pliku, bo
+    # formularz mógł się zmienić od wysłania zadania
+    results, encodes, decode_report, records, preview = item.value
+    st.write(f"Przetworzono: {item.name}")
+    if decode_report and decode_report.saved_bytes:
+        st.caption(decode_report.summary())
+    
+    cols = st.columns(2)
+    with cols[0]:
+        st.image(preview.path, caption="Podgląd", use_column_width=True)
+    
+    with cols[1]:
+        for handle in results.values():
+            (width, height), extension = output_info(handle)
+            st.download_button(
+                label=f"Pobierz {width}x{height}.{extension}",
+                data=handle.read,
+                file_name=f"{os.path.splitext(item.name)[0]}_{width}x{height}.{extension}",
+                mime=f"image/{extension}",
+            )
+    st.write("---")
+
+def show_summary(job):
+    succeeded = job.succeeded()
+    processed = job.processed()
+    total_encodes = sum(sum(item.value[1].values()) for item in processed)
+    copied = sum(passthrough.count(item.value[1]) for item in processed)
+    st.success(f"Przetworzono {len(succeeded)} z {job.total} plików w {job.seconds:.2f} sekund (kodowań: {total_encodes}, wyników bez przetwarzania: {copied}).")
+    st.caption(result_cache.summary())
+    st.caption(admission.summary())
+    if dedup_summary(job):
+        st.caption(dedup_summary(job))
+    records = [record for item in processed for record in item.value[3] or []]
+    # Logi zapisujemy raz na zadanie, nie przy każdym ponownym wyświetleniu
+    show_metrics(records, log=job.claim("metrics"))
+
 def main():
     st.title("Konwerter obrazów")
     st.write("Witamy w narzędziu do konwersji obrazów. Możesz przetwarzać zdjęcia masowo lub pojedynczo. Wybierz odpowiednią opcję z menu po lewej stronie.")
@@ -40,23 +196,38 @@ def main():
         "Niestandardowy rozmiar",
     ]
 
-    choice = st.sidebar.selectbox("Wybierz tryb", menu)
+    choice = st.sidebar.selectbox("Wybierz tryb", menu, index=mode_index(menu))
+    metrics = st.sidebar.checkbox("Pokaż czasy etapów", value=bool(LOG_PATH))
+    # Identyczne pliki są łączone zawsze, niemal identyczne na życzenie
+    similar = st.sidebar.checkbox(
+        "Łącz niemal identyczne zdjęcia",
+        value=False,
+        help="Porównanie odcisków miniatur przed przetwarzaniem. Pliki PNG są "
+        "przy tym dekodowane w całości, więc dla dużych PNG to dodatkowy koszt.",
+    )
+    # Podglądy kodowane szybko, pliki do pobrania z presetem wybranym
+    # osobno dla każdego trybu
+    effort = mode_select("Wysiłek kodowania eksportu", PRESETS, "max", choice, "effort")
+    # Metoda skalowania zapamiętywana osobno dla każdego trybu
+    resampler = mode_select("Metoda skalowania", RESAMPLERS, DEFAULT_RESAMPLER, choice, "resampler")
 
     # Przycisk "Pobierz wszystkie zdjęcia" na górze każdej zakładki
     st.sidebar.markdown("### Po przetworzeniu zdjęcia możesz spakować je do ZIP i pobrać.")
     if st.sidebar.button("Kliknij i przygotuj paczkę, ze zdjęciami.", key="download_all_top"):
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-            for file_name, results in st.session_state.get("processed_images", []):
-                for size, img_bytes in results.items():
-                    zip_file.writestr(f"{os.path.splitext(file_name)[0]}_{size}.webp", img_bytes)
-        
-        st.sidebar.download_button(
-            label="Pobierz wszystkie zdjęcia",
-            data=zip_buffer.getvalue(),
-            file_name="wszystkie_zdjecia.zip",
-            mime="application/zip",
-        )
+        job = attached_job()
+        with ZipSpool() as zip_file:
+            for item in job.succeeded() if job is not None else []:
+                file_name, results = item.name, item.value[0]
+                for size, handle in results.items():
+                    extension = output_info(handle)[1]
+                    zip_file.write(handle.path, f"{os.path.splitext(file_name)[0]}_{size}.{extension}")
+            
+            st.sidebar.download_button(
+                label="Pobierz wszystkie zdjęcia",
+                data=zip_file.finish(),
+                file_name="wszystkie_zdjecia.zip",
+                mime="application/zip",
+            )
 
     if choice == "Automatycznie dopasowany drugi wymiar":
         st.header("Automatycznie dopasowany drugi wymiar - Przetwarzanie zdjęć")
@@ -71,7 +242,12 @@ def main():
         )
 
         file_format = st.selectbox(
-            "Format pliku", options=["WEBP", "JPEG", "PNG"], index=0
+            "Format pliku", options=supported_formats(), index=0
+        )
+
+        # Formaty zapasowe kodowane w tym samym przebiegu co podstawowy
+        extra_formats = st.multiselect(
+            "Dodatkowe formaty", options=[fmt for fmt in supported_formats() if fmt != file_format]
         )
 
         uploaded_files = st.file_uploader(
@@ -79,55 +255,29 @@ def main():
         )
 
         if uploaded_files:
-            # Wyświetlanie aktualnej wysokości obrazu
-            
-            st.number_input("Aktualna wysokość dla podanej szerokości wynosi: ", int(custom_width / (Image.open(uploaded_files[0]).width / Image.open(uploaded_files[0]).height)))
+            # Wyświetlanie aktualnej wysokości obrazu - z indeksu metadanych,
+            # bez dekodowania pikseli
+            index = upload_index(uploaded_files)
+            if index[0] is not None:
+                st.number_input("Aktualna wysokość dla podanej szerokości wynosi: ", int(custom_width / index[0].aspect_ratio))
+            st.caption(planned_sizes(index, {"Nowy rozmiar": (custom_width, 0, custom_max_size)}))
 
             if st.button("Przetwórz zdjęcia"):
-                st.session_state.new_tab_processing = True
-                st.session_state.processed_images = []
-            
-            if st.session_state.get("new_tab_processing", False):
-                progress_bar = st.progress(0)
-                start_time = time.time()
-                processed_count = 0
-                
-                for i, uploaded_file in enumerate(uploaded_files):
-                    try:
-                        image = Image.open(uploaded_file)
-                        aspect_ratio = image.width / image.height
-                        new_height = int(custom_width / aspect_ratio)
-                        custom_output_sizes = {
-                            "Nowy rozmiar": (custom_width, new_height, custom_max_size)
-                        }
-                        results = process_image(image, custom_output_sizes, file_format)
-                        st.write(f"Przetworzono: {uploaded_file.name}")
-                        
-                        cols = st.columns(2)
-                        preview_image = next(iter(results.values()))
-                        with cols[0]:
-                            st.image(preview_image, caption="Podgląd", use_column_width=True)
-                        
-                        with cols[1]:
-                            processed_image = Image.open(io.BytesIO(results["Nowy rozmiar"]))
-                            st.download_button(
-                                label=f"Pobierz {custom_width}x{processed_image.height}.{file_format.lower()}",
-                                data=results["Nowy rozmiar"],
-                                file_name=f"{os.path.splitext(uploaded_file.name)[0]}_{custom_width}x{processed_image.height}.{file_format.lower()}",
-                                mime=f"image/{file_format.lower()}",
-                            )
-                        
-                        st.session_state.processed_images.append((uploaded_file.name, results))
-                        st.write("---")
-                        processed_count += 1
-                    except Exception as e:
-                        st.error(f"Błąd podczas przetwarzania {uploaded_file.name}: {str(e)}")
-                    
-                    progress_bar.progress((i + 1) / len(uploaded_files))
-                
-                end_time = time.time()
-                processing_time = end_time - start_time
-                st.success(f"Przetworzono {processed_count} z {len(uploaded_files)} plików w {processing_time:.2f} sekund.")
+                # Wysokość zostanie obliczona w process_image z proporcji obrazu
+                custom_output_sizes = {
+                    "Nowy rozmiar": (custom_width, 0, custom_max_size)
+                }
+                files = [(f.name, f.getvalue()) for f in uploaded_files]
+                submit_job(
+                    choice, "streamlit_app:process_upload", files, custom_output_sizes, (file_format, *extra_formats), metrics, effort, resampler,
+                    lookup=lambda name, data: cached_upload(name, data, custom_output_sizes, (file_format, *extra_formats), effort, resampler),
+                    perceptual=similar,
+                    index=upload_index(uploaded_files),
+                )
+
+        job = current_job(choice)
+        if job is not None:
+            show_job(job, show_single_result, show_summary)
 
     elif choice == "Masowe przetwarzanie":
         st.header("Masowe przetwarzanie zdjęć")
@@ -143,47 +293,18 @@ def main():
             "Wybierz pliki", type=["jpg", "png"], accept_multiple_files=True
         )
 
-        if uploaded_files:
-            if st.button("Przetwórz zdjęcia"):
-                st.session_state.bulk_processing = True
-                st.session_state.processed_images = []
-            
-            if st.session_state.get("bulk_processing", False):
-                progress_bar = st.progress(0)
-                start_time = time.time()
-                processed_count = 0
-                
-                for i, uploaded_file in enumerate(uploaded_files):
-                    try:
-                        image = Image.open(uploaded_file)
-                        results = process_image(image, output_sizes)
-                        st.write(f"Przetworzono: {uploaded_file.name}")
-                        
-                        cols = st.columns(3)
-                        preview_image = next(iter(results.values()))
-                        with cols[0]:
-                            st.image(preview_image, caption="Podgląd", use_column_width=True)
-                        
-                        for idx, (size, img_bytes) in enumerate(results.items()):
-                            with cols[(idx + 1) % 3]:
-                                st.download_button(
-                                    label=f"Pobierz {size}",
-                                    data=img_bytes,
-                                    file_name=f"{os.path.splitext(uploaded_file.name)[0]}_{size}.webp",
-                                    mime="image/webp",
-                                )
-                        
-                        st.session_state.processed_images.append((uploaded_file.name, results))
-                        st.write("---")
-                        processed_count += 1
-                    except Exception as e:
-                        st.error(f"Błąd podczas przetwarzania {uploaded_file.name}: {str(e)}")
-                    
-                    progress_bar.progress((i + 1) / len(uploaded_files))
-                
-                end_time = time.time()
-                processing_time = end_time - start_time
-                st.success(f"Przetworzono {processed_count} z {len(uploaded_files)} plików w {processing_time:.2f} sekund.")
+        if uploaded_files and st.button("Przetwórz zdjęcia"):
+            files = [(f.name, f.getvalue()) for f in uploaded_files]
+            submit_job(
+                choice, "streamlit_app:process_upload", files, output_sizes, "WEBP", metrics, effort, resampler,
+                lookup=lambda name, data: cached_upload(name, data, output_sizes, "WEBP", effort, resampler),
+                perceptual=similar,
+                index=upload_index(uploaded_files),
+            )
+
+        job = current_job(choice)
+        if job is not None:
+            show_job(job, show_result, show_summary)
 
     elif choice == "Pojedyncze zdjęcie":
         st.header("Przetwarzanie pojedynczego zdjęcia")
@@ -198,21 +319,33 @@ def main():
         uploaded_file = st.file_uploader("Wybierz plik", type=["jpg", "png"])
 
         if uploaded_file:
-            image = Image.open(uploaded_file)
+            # Dekodowanie w procesie aplikacji też korzysta z budżetu pikseli
+            cost = footprint(uploaded_file)
+            with recording(uploaded_file.name, metrics) as recorder, decode_budget.reserve(cost):
+                image, decode_report = decode_image(uploaded_file, max_width(output_sizes))
             st.image(image, caption="Oryginalne zdjęcie", use_column_width=True)
 
             if st.button("Przetwórz"):
-                results = process_image(image, output_sizes)
+                source_hash = content_hash(uploaded_file.getvalue())
+                with recording(uploaded_file.name, metrics) as process_recorder, decode_budget.reserve(cost):
+                    results = process_image(image, output_sizes, cache_key=source_hash, effort="fast", resampler=resampler, original_size=decode_report.original_size)
+                if recorder is not None:
+                    show_metrics(recorder.records + process_recorder.records)
+                
+                def export(size):
+                    # Wersja do pobrania liczona dopiero po kliknięciu
+                    return process_image(image, output_sizes, cache_key=source_hash, effort=effort, resampler=resampler, original_size=decode_report.original_size)[size]
+                
                 cols = st.columns(3)
                 preview_image = next(iter(results.values()))
                 with cols[0]:
                     st.image(preview_image, caption="Podgląd", use_column_width=True)
                 
-                for i, (size, img_bytes) in enumerate(results.items()):
+                for i, size in enumerate(results):
                     with cols[(i + 1) % 3]:
                         st.download_button(
                             label=f"Pobierz {size}",
-                            data=img_bytes,
+                            data=lambda size=size: export(size),
                             file_name=f"{os.path.splitext(uploaded_file.name)[0]}_{size}.webp",
                             mime="image/webp",
                         )
@@ -231,47 +364,18 @@ def main():
             "Wybierz pliki PNG z Midjourney", type=["png"], accept_multiple_files=True
         )
 
-        if uploaded_files:
-            if st.button("Przetwórz zdjęcia"):
-                st.session_state.midjourney_processing = True
-                st.session_state.processed_images = []
-            
-            if st.session_state.get("midjourney_processing", False):
-                progress_bar = st.progress(0)
-                start_time = time.time()
-                processed_count = 0
-                
-                for i, uploaded_file in enumerate(uploaded_files):
-                    try:
-                        image = Image.open(uploaded_file)
-                        results = process_image(image, output_sizes)
-                        st.write(f"Przetworzono: {uploaded_file.name}")
-                        
-                        cols = st.columns(3)
-                        preview_image = next(iter(results.values()))
-                        with cols[0]:
-                            st.image(preview_image, caption="Podgląd", use_column_width=True)
-                        
-                        for idx, (size, img_bytes) in enumerate(results.items()):
-                            with cols[(idx + 1) % 3]:
-                                st.download_button(
-                                    label=f"Pobierz {size}",
-                                    data=img_bytes,
-                                    file_name=f"{os.path.splitext(uploaded_file.name)[0]}_{size}.webp",
-                                    mime="image/webp",
-                                )
-                        
-                        st.session_state.processed_images.append((uploaded_file.name, results))
-                        st.write("---")
-                        processed_count += 1
-                    except Exception as e:
-                        st.error(f"Błąd podczas przetwarzania {uploaded_file.name}: {str(e)}")
-                    
-                    progress_bar.progress((i + 1) / len(uploaded_files))
-                
-                end_time = time.time()
-                processing_time = end_time - start_time
-                st.success(f"Przetworzono {processed_count} z {len(uploaded_files)} plików w {processing_time:.2f} sekund.")
+        if uploaded_files and st.button("Przetwórz zdjęcia"):
+            files = [(f.name, f.getvalue()) for f in uploaded_files]
+            submit_job(
+                choice, "streamlit_app:process_upload", files, output_sizes, "WEBP", metrics, effort, resampler,
+                lookup=lambda name, data: cached_upload(name, data, output_sizes, "WEBP", effort, resampler),
+                perceptual=similar,
+                index=upload_index(uploaded_files),
+            )
+
+        job = current_job(choice)
+        if job is not None:
+            show_job(job, show_result, show_summary)
 
     elif choice == "Niestandardowy rozmiar":
         st.header("Przetwarzanie zdjęć w niestandardowym rozmiarze")
@@ -286,7 +390,12 @@ def main():
         )
 
         file_format = st.selectbox(
-            "Format pliku", options=["WEBP", "JPEG", "PNG"], index=0
+            "Format pliku", options=supported_formats(), index=0
+        )
+
+        # Formaty zapasowe kodowane w tym samym przebiegu co podstawowy
+        extra_formats = st.multiselect(
+            "Dodatkowe formaty", options=[fmt for fmt in supported_formats() if fmt != file_format]
         )
 
         custom_output_sizes = {
@@ -298,51 +407,20 @@ def main():
         )
 
         if uploaded_files:
-            if st.button("Przetwórz zdjęcia"):
-                st.session_state.custom_processing = True
-                st.session_state.processed_images = []
-            
-            if st.session_state.get("custom_processing", False):
-                progress_bar = st.progress(0)
-                start_time = time.time()
-                processed_count = 0
-                
-                for i, uploaded_file in enumerate(uploaded_files):
-                    try:
-                        image = Image.open(uploaded_file)
-                        aspect_ratio = image.width / image.height
-                        new_height = int(custom_width / aspect_ratio)
-                        custom_output_sizes = {
-                            "Niestandardowy": (custom_width, new_height, custom_max_size)
-                        }
-                        results = process_image(image, custom_output_sizes, file_format)
-                        st.write(f"Przetworzono: {uploaded_file.name}")
-                        
-                        cols = st.columns(2)
-                        preview_image = next(iter(results.values()))
-                        with cols[0]:
-                            st.image(preview_image, caption="Podgląd", use_column_width=True)
-                        
-                        with cols[1]:
-                            processed_image = Image.open(io.BytesIO(results["Niestandardowy"]))
-                            st.download_button(
-                                label=f"Pobierz {custom_width}x{processed_image.height}.{file_format.lower()}",
-                                data=results["Niestandardowy"],
-                                file_name=f"{os.path.splitext(uploaded_file.name)[0]}_{custom_width}x{processed_image.height}.{file_format.lower()}",
-                                mime=f"image/{file_format.lower()}",
-                            )
-                        
-                        st.session_state.processed_images.append((uploaded_file.name, results))
-                        st.write("---")
-                        processed_count += 1
-                    except Exception as e:
-                        st.error(f"Błąd podczas przetwarzania {uploaded_file.name}: {str(e)}")
-                    
-                    progress_bar.progress((i + 1) / len(uploaded_files))
-                
-                end_time = time.time()
-                processing_time = end_time - start_time
-                st.success(f"Przetworzono {processed_count} z {len(uploaded_files)} plików w {processing_time:.2f} sekund.")
+            st.caption(planned_sizes(upload_index(uploaded_files), custom_output_sizes))
+
+        if uploaded_files and st.button("Przetwórz zdjęcia"):
+            files = [(f.name, f.getvalue()) for f in uploaded_files]
+            submit_job(
+                choice, "streamlit_app:process_upload", files, custom_output_sizes, (file_format, *extra_formats), metrics, effort, resampler,
+                lookup=lambda name, data: cached_upload(name, data, custom_output_sizes, (file_format, *extra_formats), effort, resampler),
+                perceptual=similar,
+                index=upload_index(uploaded_files),
+            )
+
+        job = current_job(choice)
+        if job is not None:
+            show_job(job, show_single_result, show_summary)
 
 if __name__ == "__main__":
     main()